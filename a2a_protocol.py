@@ -1,8 +1,10 @@
 import json
+import time
 import uuid
 import asyncio
 from datetime import datetime
 from typing import Dict, Any, List, Optional
+from collections import OrderedDict
 from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
@@ -101,6 +103,93 @@ class A2AAgent(ABC):
         avg = self.metrics["avg_processing_time"]
         self.metrics["avg_processing_time"] = (avg * (n-1) + processing_time) / n
 
+class EventSubscription:
+    """One subscriber's bounded buffer. When it overflows, the oldest event is dropped."""
+
+    def __init__(self, workflow_id: str, maxsize: int):
+        self.workflow_id = workflow_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def push(self, event: Dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class WorkflowEventBus:
+    """
+    In-process fan-out of workflow step events. Keeps the latest state per
+    workflow so a new subscriber gets a snapshot instead of polling every agent.
+    Publishing never blocks: slow subscribers lose their oldest events.
+    """
+
+    def __init__(self, buffer_size: int = 64, max_subscribers: int = 50,
+                 max_workflows: int = 10000):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.max_workflows = max_workflows
+        self._subscribers: Dict[str, set] = {}
+        self._state: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def subscribe(self, workflow_id: str) -> EventSubscription:
+        subs = self._subscribers.setdefault(workflow_id, set())
+        if len(subs) >= self.max_subscribers:
+            raise OverflowError(f"Too many subscribers for workflow {workflow_id}")
+        sub = EventSubscription(workflow_id, self.buffer_size)
+        subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: EventSubscription):
+        subs = self._subscribers.get(sub.workflow_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.workflow_id]
+
+    def snapshot(self, workflow_id: str) -> Optional[Dict]:
+        state = self._state.get(workflow_id)
+        return None if state is None else {**state, "steps": dict(state["steps"])}
+
+    def publish(self, workflow_id: str, step: str, status: str, **data) -> Dict:
+        state = self._state.get(workflow_id)
+        if state is None:
+            state = {"workflow_id": workflow_id, "seq": 0, "status": "running", "steps": {}}
+            self._state[workflow_id] = state
+            while len(self._state) > self.max_workflows:
+                self._state.popitem(last=False)
+        self._state.move_to_end(workflow_id)
+
+        state["seq"] += 1
+        if step == "workflow":
+            state["status"] = status
+        else:
+            state["steps"][step] = status
+        event = {
+            "workflow_id": workflow_id,
+            "seq": state["seq"],
+            "step": step,
+            "status": status,
+            "timestamp": datetime.utcnow().isoformat(),
+            **data,
+        }
+        for sub in self._subscribers.get(workflow_id, ()):
+            sub.push(event)
+        return event
+
+    def subscriber_count(self, workflow_id: Optional[str] = None) -> int:
+        if workflow_id is not None:
+            return len(self._subscribers.get(workflow_id, ()))
+        return sum(len(s) for s in self._subscribers.values())
+
+
 class A2ACoordinator:
     """Central coordinator for A2A message routing."""
     
@@ -109,11 +198,29 @@ class A2ACoordinator:
         self.message_log: List[A2AMessage] = []
         self.workflows: Dict[str, Dict] = {}
         self.running = False
+        self.events = WorkflowEventBus()
+        self.topic_subscribers: Dict[str, set] = {}
     
     def register_agent(self, agent_id: str, agent: A2AAgent):
-        """Register an agent with the coordinator."""
+        """Register an agent with the coordinator (and the topics it declares)."""
         self.agents[agent_id] = agent
+        topics = tuple(getattr(agent, "topics", ()) or ())
+        if topics:
+            self.subscribe(agent_id, *topics)
         logger.info(f"Registered agent: {agent_id}")
+
+    def subscribe(self, agent_id: str, *topics: str):
+        """Subscribe an agent to broadcast topics. "*" receives every topic."""
+        for topic in topics:
+            self.topic_subscribers.setdefault(topic, set()).add(agent_id)
+
+    def unsubscribe(self, agent_id: str, *topics: str):
+        for topic in topics or list(self.topic_subscribers):
+            subs = self.topic_subscribers.get(topic)
+            if subs:
+                subs.discard(agent_id)
+                if not subs:
+                    del self.topic_subscribers[topic]
     
     async def send_message(self, sender: str, receiver: str, 
                           message_type: MessageType, payload: Dict) -> A2AMessage:
@@ -140,28 +247,78 @@ class A2ACoordinator:
             logger.error(f"Unknown receiver: {receiver}")
             return message
     
-    async def broadcast_message(self, sender: str, payload: Dict, 
-                               exclude: List[str] = None):
-        """Broadcast a message to all agents."""
-        exclude = exclude or []
-        tasks = []
-        
-        for agent_id, agent in self.agents.items():
-            if agent_id not in exclude and agent_id != sender:
-                message = A2AMessage(
-                    id=str(uuid.uuid4()),
-                    type=MessageType.BROADCAST,
-                    sender=sender,
-                    receiver=agent_id,
-                    timestamp=datetime.utcnow().isoformat(),
-                    payload=payload
-                )
-                tasks.append(agent.process_message(message))
-        
-        await asyncio.gather(*tasks)
+    async def run_step(self, workflow_id: str, receiver: str, payload: Dict,
+                       sender: str = "workflow") -> A2AMessage:
+        """send_message for a workflow step, publishing started/completed/failed events."""
+        step = payload.get("action", receiver)
+        self.events.publish(workflow_id, step, "started", agent=receiver)
+        try:
+            response = await self.send_message(
+                sender=sender,
+                receiver=receiver,
+                message_type=MessageType.REQUEST,
+                payload=payload
+            )
+        except Exception as e:
+            self.events.publish(workflow_id, step, "failed", agent=receiver, error=str(e))
+            raise
+        self.events.publish(workflow_id, step, "completed", agent=receiver)
+        return response
+
+    async def broadcast_message(self, sender: str, payload: Dict,
+                               exclude: List[str] = None, topic: Optional[str] = None,
+                               timeout: float = 5.0, max_concurrency: int = 8) -> Dict[str, Dict]:
+        """Publish a message to the agents subscribed to its topic.
+
+        The topic comes from `topic` or payload["topic"]; without one the
+        message goes to every agent, as before. Each delivery has its own
+        timeout and at most `max_concurrency` run at once, so one slow agent
+        can't stall the rest. Returns a delivery result per subscriber.
+        """
+        exclude = set(exclude or [])
+        exclude.add(sender)
+        topic = topic or payload.get("topic")
+        if topic:
+            recipients = self.topic_subscribers.get(topic, set()) | self.topic_subscribers.get("*", set())
+        else:
+            recipients = set(self.agents)
+        recipients = [a for a in self.agents if a in recipients and a not in exclude]
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def deliver(agent_id: str) -> Dict:
+            message = A2AMessage(
+                id=str(uuid.uuid4()),
+                type=MessageType.BROADCAST,
+                sender=sender,
+                receiver=agent_id,
+                timestamp=datetime.utcnow().isoformat(),
+                payload=payload,
+                ttl=int(timeout)
+            )
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await asyncio.wait_for(self.agents[agent_id].process_message(message), timeout)
+                    result = {"delivered": True}
+                except asyncio.TimeoutError:
+                    result = {"delivered": False, "error": "timeout"}
+                except Exception as e:
+                    result = {"delivered": False, "error": str(e)}
+                result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if not result["delivered"]:
+                logger.warning(f"Broadcast to {agent_id} failed: {result['error']}")
+            return result
+
+        results = await asyncio.gather(*(deliver(a) for a in recipients))
+        return dict(zip(recipients, results))
     
-    async def get_workflow_status(self, workflow_id: str) -> Dict:
-        """Get status of a workflow across all agents."""
+    async def get_workflow_status(self, workflow_id: str, max_sites: Optional[int] = None) -> Dict:
+        """Get status of a workflow across all agents.
+
+        max_sites is passed on to agents and caps how many sites are merged,
+        so callers that only show a few don't pay for the full list.
+        """
         status = {
             "workflow_id": workflow_id,
             "status": "unknown",
@@ -180,7 +337,8 @@ class A2ACoordinator:
                     message_type=MessageType.REQUEST,
                     payload={
                         "action": "get_status",
-                        "workflow_id": workflow_id
+                        "workflow_id": workflow_id,
+                        "max_sites": max_sites
                     }
                 )
                 
@@ -191,7 +349,8 @@ class A2ACoordinator:
                     if "programs" in response.payload:
                         status["programs"].extend(response.payload["programs"])
                     if "sites" in response.payload:
-                        status["sites"].extend(response.payload["sites"])
+                        room = None if max_sites is None else max_sites - len(status["sites"])
+                        status["sites"].extend(response.payload["sites"][:room])
                     if "next_steps" in response.payload:
                         status["next_steps"].extend(response.payload["next_steps"])
                     if "monthly_value" in response.payload:
@@ -222,7 +381,8 @@ class A2ACoordinator:
         """Get metrics from all agents."""
         metrics = {}
         for agent_id, agent in self.agents.items():
-            metrics[agent_id] = agent.metrics
+            # BaseAgent-style agents don't keep A2AAgent metrics
+            metrics[agent_id] = getattr(agent, "metrics", {})
         metrics["total_messages"] = len(self.message_log)
         return metrics
 
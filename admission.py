@@ -0,0 +1,307 @@
+# admission.py
+"""
+Admission control / load shedding for peak enrollment days.
+
+Every matched request has to get past, in order:
+  1. its client's token bucket (keyed by verified Firebase uid, else client IP) -> 429
+  2. the route's concurrency limit, waiting at most the route's queue budget -> 503
+  3. the shared backend limit, where status reads are woken before new writes -> 503
+
+Rejections are immediate when the queue is already full, and always carry
+Retry-After so well-behaved clients back off instead of hammering us.
+"""
+import json
+import time
+import heapq
+import hashlib
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# lower value = served first
+PRIORITY_READ = 0
+PRIORITY_WRITE = 1
+
+
+@dataclass
+class RouteRule:
+    path: str
+    methods: Set[str] = field(default_factory=lambda: {"GET"})
+    prefix: bool = False
+    max_concurrent: int = 32
+    max_queue: int = 100
+    queue_timeout: float = 2.0      # seconds a request may wait for a slot
+    priority: int = PRIORITY_WRITE
+    rate: float = 5.0               # tokens per second per client
+    burst: int = 10
+
+    def matches(self, method: str, path: str) -> bool:
+        if method not in self.methods:
+            return False
+        return path.startswith(self.path) if self.prefix else path == self.path
+
+
+class PriorityLimiter:
+    """Concurrency limiter whose waiters are woken by (priority, arrival)."""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    def try_acquire(self) -> bool:
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        if self.try_acquire():
+            return True
+        if self.queued >= self.max_queue or timeout <= 0:
+            return False
+        if len(self._waiters) > 2 * self.max_queue:
+            # drop entries left behind by timed-out waiters
+            self._waiters = [w for w in self._waiters if not w[2].done()]
+            heapq.heapify(self._waiters)
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        # asyncio.wait, not wait_for: on 3.11 wait_for swallows a cancellation that lands
+        # just as the slot is handed over, and the cancelled caller would keep the slot
+        try:
+            await asyncio.wait((fut,), timeout=timeout)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # handed a slot we can no longer use; pass it on
+            else:
+                fut.cancel()
+            raise
+        if fut.done() and not fut.cancelled():
+            return True  # includes a slot handed over just as we timed out
+        fut.cancel()
+        return False
+
+    def release(self):
+        # hand the slot straight to the best live waiter, if any
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self.active -= 1
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: int):
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, burst: int) -> float:
+        """Take one token; returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate if rate > 0 else 60.0
+
+
+class VerifiedTokens:
+    """
+    Bounded LRU of ID tokens some route has already verified (token hash -> uid, exp).
+    Admission runs before auth and can't afford a signature check per request,
+    so a token only picks a per-user bucket once get_current_user has vouched for it.
+    """
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._tokens: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8", "replace")).hexdigest()
+
+    def remember(self, token: str, claims: Dict[str, Any]):
+        uid = claims.get("uid") or claims.get("user_id") or claims.get("sub")
+        if not uid:
+            return
+        key = self._hash(token)
+        self._tokens[key] = (uid, float(claims.get("exp") or time.time() + 3600))
+        self._tokens.move_to_end(key)
+        while len(self._tokens) > self.max_entries:
+            self._tokens.popitem(last=False)
+
+    def uid_for(self, token: str) -> Optional[str]:
+        key = self._hash(token)
+        entry = self._tokens.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            del self._tokens[key]
+            return None
+        self._tokens.move_to_end(key)
+        return entry[0]
+
+
+verified_tokens = VerifiedTokens()
+
+
+def client_key(scope, trusted_proxy_hops: int = 1, verified: Optional[VerifiedTokens] = None) -> str:
+    """
+    Verified Firebase uid, else the client address as seen by our own proxy.
+
+    Unverified token claims and the left part of X-Forwarded-For are both
+    client-controlled, so neither is used: with trusted_proxy_hops=N the
+    address is the Nth entry from the right (what our front end appended;
+    1 on Cloud Run), with 0 it's the TCP peer.
+    """
+    headers = dict(scope.get("headers") or [])
+    if verified is not None:
+        auth = headers.get(b"authorization", b"").decode("latin-1")
+        if auth.startswith("Bearer "):
+            uid = verified.uid_for(auth.split(" ", 1)[1])
+            if uid:
+                return f"uid:{uid}"
+    if trusted_proxy_hops > 0:
+        hops = [h.strip() for h in headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",") if h.strip()]
+        if len(hops) >= trusted_proxy_hops:
+            return f"ip:{hops[-trusted_proxy_hops]}"
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+
+class AdmissionController:
+    def __init__(self, rules: List[RouteRule], backend_concurrency: int = 64,
+                 backend_queue: int = 500, max_clients: int = 100_000,
+                 trusted_proxy_hops: int = 1, verified: Optional[VerifiedTokens] = verified_tokens):
+        self.rules = rules
+        self.trusted_proxy_hops = trusted_proxy_hops
+        self.verified = verified
+        self.route_limiters = {r.path: PriorityLimiter(r.max_concurrent, r.max_queue) for r in rules}
+        self.backend = PriorityLimiter(backend_concurrency, backend_queue)
+        self.max_clients = max_clients
+        # least recently used first; evicting one idle client never resets anyone else
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.counters: Dict[str, Dict[str, int]] = {
+            r.path: {"admitted": 0, "queued": 0, "shed_capacity": 0, "shed_rate": 0} for r in rules
+        }
+
+    def match(self, method: str, path: str) -> Optional[RouteRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    def _bucket(self, rule: RouteRule, client: str) -> TokenBucket:
+        key = (rule.path, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            while len(self._buckets) >= self.max_clients:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = TokenBucket(rule.burst)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def client_key(self, scope) -> str:
+        return client_key(scope, self.trusted_proxy_hops, self.verified)
+
+    async def admit(self, rule: RouteRule, client: str) -> Tuple[bool, int, float]:
+        """Returns (admitted, status_if_rejected, retry_after_seconds)."""
+        counters = self.counters[rule.path]
+        wait = self._bucket(rule, client).take(rule.rate, rule.burst)
+        if wait:
+            counters["shed_rate"] += 1
+            return False, 429, wait
+
+        deadline = time.monotonic() + rule.queue_timeout
+        route = self.route_limiters[rule.path]
+        if not route.try_acquire():
+            counters["queued"] += 1
+            if not await route.acquire(rule.priority, deadline - time.monotonic()):
+                counters["shed_capacity"] += 1
+                return False, 503, max(1.0, rule.queue_timeout)
+        if not self.backend.try_acquire():
+            counters["queued"] += 1
+            try:
+                got = await self.backend.acquire(rule.priority, deadline - time.monotonic())
+            except BaseException:
+                route.release()
+                raise
+            if not got:
+                route.release()
+                counters["shed_capacity"] += 1
+                return False, 503, max(1.0, rule.queue_timeout)
+
+        counters["admitted"] += 1
+        return True, 200, 0.0
+
+    def release(self, rule: RouteRule):
+        self.backend.release()
+        self.route_limiters[rule.path].release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "routes": {
+                path: {
+                    **c,
+                    "in_flight": self.route_limiters[path].active,
+                    "waiting": self.route_limiters[path].queued,
+                }
+                for path, c in self.counters.items()
+            },
+            "backend": {"in_flight": self.backend.active, "waiting": self.backend.queued,
+                        "limit": self.backend.limit},
+            "tracked_clients": len(self._buckets),
+        }
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware so rejected requests never reach routing or body parsing."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        rule = self.controller.match(scope["method"], scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        ok, status, retry_after = await self.controller.admit(rule, self.controller.client_key(scope))
+        if not ok:
+            return await self._reject(send, status, retry_after)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(rule)
+
+    @staticmethod
+    async def _reject(send, status: int, retry_after: float):
+        detail = "Too many requests" if status == 429 else "Server busy, please retry"
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
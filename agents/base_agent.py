@@ -8,6 +8,9 @@ class BaseAgent:
     Your A2ACoordinator calls agent.process_message(message), so we
     translate that into handler calls based on payload["action"].
     """
+    # broadcast topics this agent wants; the coordinator subscribes it on register
+    topics: tuple = ()
+
     def __init__(self, agent_id: str = "agent"):
         self.agent_id = agent_id
         self._handlers: Dict[str, Callable[[dict], Awaitable[dict]]] = {}
@@ -1,14 +1,40 @@
 # agents/calendar_agent.py
 
+import uuid
+import hashlib
+from datetime import datetime, timezone
+
+from .calendar_feed import IcsFeedStore, render_vevent
+
+
 class CalendarAgent:
+    topics = ("sites", "schedule")
+
     def __init__(self):
-        self.events = {}
+        self.events = {}    # event_id -> booking
+        self.bookings = {}  # family_id -> {event_id: booking}
+        self.feeds = IcsFeedStore()
 
     async def process_message(self, message):
         action = message.payload.get("action")
         if action in ("schedule_pickup", "suggest_schedule"):
-            # Fake calendar event creation
-            event_id = f"evt-{message.payload.get('family_id', 'demo')}-123"
+            family_id = message.payload.get("family_id", "demo")
+            if action == "schedule_pickup" and message.payload.get("pickup_date"):
+                try:
+                    booking = self.book(family_id, message.payload)
+                except ValueError as e:
+                    return message.__class__(
+                        id=message.id,
+                        type=message.type,
+                        sender="calendar",
+                        receiver=message.sender,
+                        timestamp=message.timestamp,
+                        payload={"error": f"Invalid pickup_date: {e}"}
+                    )
+                event_id, confirmation = booking["event_id"], booking["confirmation"]
+            else:
+                # suggestions don't create a booking, but the feed URL is usable right away
+                event_id, confirmation = None, None
             return message.__class__(
                 id=message.id,
                 type=message.type,
@@ -17,10 +43,21 @@ class CalendarAgent:
                 timestamp=message.timestamp,
                 payload={
                     "event_id": event_id,
-                    "confirmation": "CONFIRM123",
+                    "confirmation": confirmation,
                     "qr_code": None,
+                    "feed_url": self.feeds.feed_url(family_id),
                 }
             )
+        elif action == "cancel_pickup":
+            cancelled = self.cancel(message.payload.get("family_id"), message.payload.get("event_id"))
+            return message.__class__(
+                id=message.id,
+                type=message.type,
+                sender="calendar",
+                receiver=message.sender,
+                timestamp=message.timestamp,
+                payload={"cancelled": cancelled}
+            )
         elif action == "get_status":
             return message.__class__(
                 id=message.id,
@@ -37,3 +74,31 @@ class CalendarAgent:
                 }
             )
         return None
+
+    def book(self, family_id: str, payload: dict) -> dict:
+        """Raises ValueError for an unparseable pickup_date; nothing is stored in that case."""
+        event_id = f"evt-{uuid.uuid4().hex[:16]}"
+        booking = {
+            "event_id": event_id,
+            "family_id": family_id,
+            "site_id": payload.get("site_id"),
+            "site": payload.get("site") or {},
+            "pickup_date": payload["pickup_date"],
+            "meal_type": payload.get("meal_type", "all"),
+            "confirmation": hashlib.sha1(event_id.encode()).hexdigest()[:8].upper(),
+            "sequence": 0,
+            "updated_at": datetime.now(timezone.utc),
+        }
+        vevent = render_vevent(booking)  # parses pickup_date; fail before anything is stored
+        self.events[event_id] = booking
+        self.bookings.setdefault(family_id, {})[event_id] = booking
+        # only this family's feed is touched, and only this event is re-rendered
+        self.feeds.upsert_event(family_id, booking, vevent)
+        return booking
+
+    def cancel(self, family_id: str, event_id: str) -> bool:
+        booking = self.bookings.get(family_id, {}).pop(event_id, None)
+        if booking is None:
+            return False
+        self.events.pop(event_id, None)
+        return self.feeds.remove_event(family_id, event_id)
@@ -0,0 +1,195 @@
+# agents/calendar_feed.py
+"""
+Per-family iCalendar feeds kept as precomputed, gzip-compressed snapshots.
+
+Calendar apps poll subscription URLs constantly, so nothing is generated at
+poll time. Each booking's VEVENT is rendered once when it changes; the
+family's feed is then re-assembled from those cached chunks and compressed.
+Polls just hand back the stored bytes, or a 304 when the ETag/Last-Modified match.
+
+Calendar apps can't send a bearer token, so each feed gets an unguessable
+token when it's created and the subscription URL is keyed by that, never by
+the family_id.
+"""
+import gzip
+import hashlib
+import secrets
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
+
+PRODID = "-//MealSync//Meal Pickups//EN"
+
+
+def _escape(text: Any) -> str:
+    return (str(text or "").replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line: str) -> str:
+    """RFC 5545 line folding: max 75 octets per line, continuation lines start with a space."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            end -= 1
+        parts.append(data[start:end].decode("utf-8"))
+        start, limit = end, 74
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _stamp(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _dtstart(pickup: str) -> str:
+    """All-day for plain dates, floating local time for date-times (the site's own timezone)."""
+    if "T" not in pickup:
+        return "DTSTART;VALUE=DATE:" + datetime.fromisoformat(pickup).strftime("%Y%m%d")
+    dt = datetime.fromisoformat(pickup.replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        return "DTSTART:" + _stamp(dt)
+    return "DTSTART:" + dt.strftime("%Y%m%dT%H%M%S")
+
+
+def render_vevent(booking: Dict[str, Any]) -> str:
+    site = booking.get("site") or {}
+    meal = booking.get("meal_type") or "all"
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{booking['event_id']}@mealsync",
+        f"DTSTAMP:{_stamp(booking['updated_at'])}",
+        f"SEQUENCE:{booking.get('sequence', 0)}",
+        _dtstart(booking["pickup_date"]),
+        f"SUMMARY:{_escape('Meal pickup - ' + (site.get('name') or booking.get('site_id', '')))}",
+        f"DESCRIPTION:{_escape(f'Meals: {meal}. Confirmation: ' + booking.get('confirmation', ''))}",
+    ]
+    if site.get("address"):
+        lines.append(f"LOCATION:{_escape(site['address'])}")
+    if "lat" in site and "lng" in site:
+        lines.append(f"GEO:{site['lat']:.6f};{site['lng']:.6f}")
+    lines += [
+        "BEGIN:VALARM", "ACTION:DISPLAY", "TRIGGER:-PT1H",
+        f"DESCRIPTION:{_escape('Meal pickup in 1 hour')}", "END:VALARM",
+        "END:VEVENT",
+    ]
+    return "".join(_fold(l) for l in lines)
+
+
+@dataclass
+class FeedSnapshot:
+    gzipped: bytes
+    raw_length: int
+    etag: str
+    last_modified: datetime
+
+    def body(self, accept_gzip: bool) -> bytes:
+        return self.gzipped if accept_gzip else gzip.decompress(self.gzipped)
+
+    def etag_for(self, accept_gzip: bool) -> str:
+        """Each encoding is its own representation, so it gets its own strong ETag."""
+        return self.etag[:-1] + '-gzip"' if accept_gzip else self.etag
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Accept-Encoding parsing with q-values: "gzip;q=0" is a refusal, "*" counts."""
+    allowed = None
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if coding not in ("gzip", "x-gzip", "*"):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding == "*":
+            if allowed is None:  # an explicit gzip entry wins over the wildcard
+                allowed = q > 0
+        else:
+            return q > 0
+    return bool(allowed)
+
+
+@dataclass
+class _Feed:
+    token: str = field(default_factory=lambda: secrets.token_urlsafe(24))
+    vevents: "OrderedDict[str, str]" = field(default_factory=OrderedDict)
+    snapshot: Optional[FeedSnapshot] = None
+
+
+class IcsFeedStore:
+    def __init__(self, calendar_name: str = "MealSync pickups"):
+        self.calendar_name = calendar_name
+        self._feeds: Dict[str, _Feed] = {}
+        self._by_token: Dict[str, str] = {}  # feed token -> family_id
+        self.stats = {"rebuilds": 0, "events_rendered": 0}
+
+    def upsert_event(self, family_id: str, booking: Dict[str, Any], vevent: Optional[str] = None):
+        """vevent lets callers render (and validate) first; otherwise it's rendered here."""
+        vevent = vevent if vevent is not None else render_vevent(booking)
+        feed = self._feed(family_id)
+        feed.vevents[booking["event_id"]] = vevent
+        self.stats["events_rendered"] += 1
+        self._rebuild(family_id, feed)
+
+    def remove_event(self, family_id: str, event_id: str) -> bool:
+        feed = self._feeds.get(family_id)
+        if not feed or feed.vevents.pop(event_id, None) is None:
+            return False
+        self._rebuild(family_id, feed)
+        return True
+
+    def ensure_feed(self, family_id: str) -> str:
+        """Create an empty feed so a family can subscribe before the first booking. Returns its token."""
+        return self._feed(family_id).token
+
+    def feed_url(self, family_id: str) -> str:
+        return f"/api/calendar/{self.ensure_feed(family_id)}.ics"
+
+    def snapshot(self, family_id: str) -> Optional[FeedSnapshot]:
+        feed = self._feeds.get(family_id)
+        return feed.snapshot if feed else None
+
+    def snapshot_for_token(self, token: str) -> Optional[FeedSnapshot]:
+        family_id = self._by_token.get(token)
+        return self.snapshot(family_id) if family_id is not None else None
+
+    def _feed(self, family_id: str) -> _Feed:
+        feed = self._feeds.get(family_id)
+        if feed is None:
+            feed = self._feeds[family_id] = _Feed()
+            self._by_token[feed.token] = family_id
+            self._rebuild(family_id, feed)
+        return feed
+
+    def _rebuild(self, family_id: str, feed: _Feed):
+        """Only the changed VEVENT was re-rendered; this just concatenates and compresses."""
+        header = "".join(_fold(l) for l in (
+            "BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH", f"X-WR-CALNAME:{_escape(self.calendar_name)}",
+            "REFRESH-INTERVAL;VALUE=DURATION:PT6H", "X-PUBLISHED-TTL:PT6H",
+        ))
+        raw = (header + "".join(feed.vevents.values()) + "END:VCALENDAR\r\n").encode("utf-8")
+        etag = '"' + hashlib.sha1(raw).hexdigest()[:32] + '"'
+        if feed.snapshot and feed.snapshot.etag == etag:
+            return  # content unchanged; keep Last-Modified stable
+        modified = datetime.now(timezone.utc).replace(microsecond=0)
+        if feed.snapshot and modified <= feed.snapshot.last_modified:
+            # HTTP dates have 1s resolution; keep If-Modified-Since honest for rapid edits
+            modified = feed.snapshot.last_modified + timedelta(seconds=1)
+        feed.snapshot = FeedSnapshot(
+            gzipped=gzip.compress(raw, compresslevel=9, mtime=0),
+            raw_length=len(raw),
+            etag=etag,
+            last_modified=modified,
+        )
+        self.stats["rebuilds"] += 1
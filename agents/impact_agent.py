@@ -3,6 +3,8 @@
 from datetime import datetime
 
 class ImpactAgent:
+    topics = ("enrollment",)
+
     def __init__(self):
         self.metrics = {
             "families_enrolled": 10,
@@ -2,6 +2,7 @@ import logging
 from datetime import datetime
 from typing import Dict, Any
 from .base_agent import BaseAgent
+from school_directory import SchoolDirectory
 # optional (only if you use them):
 # from models import Family
 # from database import FirestoreDB
@@ -10,6 +11,8 @@ logger = logging.getLogger(__name__)
 class IntakeAgent(BaseAgent):
     def __init__(self):
         super().__init__(agent_id="intake")
+        # district CSV via SCHOOL_DIRECTORY_CSV; also backs /api/schools/search
+        self.schools = SchoolDirectory.from_env()
 
         @self.on("start_workflow")
         async def _start(payload: Dict[str, Any]):
@@ -18,7 +21,13 @@ class IntakeAgent(BaseAgent):
 
         @self.on("verify_enrollment")
         async def _verify(payload: Dict[str, Any]):
-            return {"status": "verified", "note": "school enrollment assumed for demo"}
+            school_name = payload.get("school_name") or ""
+            school = self.schools.match(school_name)
+            if school:
+                return {"status": "verified", "school": school}
+            logger.info("School %r not in directory for family %s", school_name, payload.get("family_id"))
+            return {"status": "needs_review", "note": "school not found in directory",
+                    "suggestions": self.schools.search(school_name, limit=3)}
 
         @self.on("get_status")
         async def _status(payload: Dict[str, Any]):
@@ -1,16 +1,48 @@
 # agents/locator_agent.py
 import os
+import heapq
+import asyncio
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, AsyncIterator, Optional
 from .base_agent import BaseAgent
+from .site_assignment import assign_families
+from geocoding import GeocodingService, haversine_miles
 
 logger = logging.getLogger(__name__)
 
+# demo catalogue until sites come from Firestore
+DEMO_SITES: List[Dict[str, Any]] = [
+    {"id": "site-001", "name": "Lincoln Cafeteria", "address": "123 Main St", "phone": "(555) 111-2222",
+     "lat": 41.8800, "lng": -87.6300, "daily_capacity": 400,
+     "meal_types": ["breakfast", "lunch"], "accessibility": ["wheelchair", "parking"]},
+    {"id": "site-002", "name": "Washington Community Center", "address": "45 Oak Ave", "phone": "(555) 333-4444",
+     "lat": 41.9010, "lng": -87.6550, "daily_capacity": 250,
+     "meal_types": ["breakfast", "lunch", "supper"], "accessibility": ["wheelchair", "transit"]},
+    {"id": "site-003", "name": "Jefferson Library Pickup", "address": "900 Elm St", "phone": "(555) 555-6666",
+     "lat": 41.8500, "lng": -87.6100, "daily_capacity": 150,
+     "meal_types": ["lunch", "snacks"], "accessibility": ["parking"]},
+]
+
+# what the intake workflow shows a family; without these a national catalogue returns every row
+BEST_SITES_RADIUS_MILES = 10.0
+BEST_SITES_LIMIT = 10
+
 class LocatorAgent(BaseAgent):
+    topics = ("sites",)
+
     def __init__(self):
         super().__init__(agent_id="locator")
         # keep in sync with your deploy flag: --set-secrets MAPS_API_KEY=...
         self.maps_api_key = os.getenv("MAPS_API_KEY")  # not GOOGLE_MAPS_API_KEY
+        # cache-first geocoder; falls back to a local fake geocoder when there's no key
+        self.geocoder = GeocodingService.from_env(self.maps_api_key)
+        # national site list, built offline with `python site_catalogue.py build ...`;
+        # when set, self.sites only holds live edits made on top of it
+        self.catalogue = self._open_catalogue(os.getenv("SITE_CATALOGUE_PATH"))
+        self.sites: List[Dict[str, Any]] = [] if self.catalogue else [dict(s) for s in DEMO_SITES]
+        self._removed: set = set()  # catalogue ids removed at runtime
+        # called with the site dict whenever a site is added, changed or removed
+        self.site_listeners: List[Callable[[Dict[str, Any]], None]] = []
 
         @self.on("find_sites")
         async def _find(payload: Dict[str, Any]):
@@ -18,19 +50,185 @@ class LocatorAgent(BaseAgent):
             if not self.maps_api_key:
                 logger.warning("MAPS_API_KEY not set; returning demo site list")
 
-            loc = payload.get("location", {})
-            sites: List[Dict[str, Any]] = [{
-                "id": "site-001", "name": "Lincoln Cafeteria",
-                "address": "123 Main St", "phone": "(555) 111-2222",
-                "distance_miles": 1.2, "meal_types": ["breakfast", "lunch"],
-                "accessibility": ["wheelchair", "parking"]
-            }]
+            loc = payload.get("location") or {}
+            meal_type = (payload.get("filters") or {}).get("meal_type")
+            limit, radius_miles = payload.get("limit"), payload.get("radius_miles")
+            if self.catalogue and not limit and radius_miles is None:
+                return {"sites": [], "error": "radius_miles or limit is required with a site catalogue"}
+            sites: List[Dict[str, Any]] = []
+            async for site in self.iter_sites(loc, radius_miles, meal_type):
+                sites.append(site)
+                if limit and len(sites) >= limit:
+                    break
             return {"sites": sites}
 
         @self.on("find_best_sites")
         async def _best(payload: Dict[str, Any]):
-            return await _find(payload)
+            # intake only gives us a free-text address; resolve it once via the cache
+            if not payload.get("location") and payload.get("address"):
+                result = await self.geocoder.geocode(payload["address"])
+                if result:
+                    payload = {**payload, "location": result.as_location()}
+                else:
+                    logger.warning("Could not geocode address for family %s", payload.get("family_id"))
+            return await _find({"radius_miles": BEST_SITES_RADIUS_MILES, "limit": BEST_SITES_LIMIT, **payload})
+
+        @self.on("geocode_addresses")
+        async def _geocode(payload: Dict[str, Any]):
+            results = await self.geocoder.geocode_many(payload.get("addresses", []))
+            return {"locations": [r.as_location() if r else None for r in results]}
+
+        @self.on("assign_sites")
+        async def _assign(payload: Dict[str, Any]):
+            """
+            Batch mode: assign a whole district's families to sites in one pass,
+            respecting daily capacity and meal_types / accessibility needs.
+            """
+            families = list(payload.get("families", []))
+            missing = [i for i, f in enumerate(families) if "lat" not in f and f.get("address")]
+            if missing:
+                results = await self.geocoder.geocode_many([families[i]["address"] for i in missing])
+                for i, r in zip(missing, results):
+                    if r:
+                        families[i] = {**families[i], "lat": r.lat, "lng": r.lng}
+            located = [f for f in families if "lat" in f and "lng" in f]
+            k, max_distance = payload.get("candidates", 8), payload.get("max_distance_miles")
+
+            # CPU-bound; keep it off the event loop
+            if not payload.get("sites") and self.catalogue and not self.sites and not self._removed:
+                out = await asyncio.to_thread(self.catalogue.assign_families, located, k, max_distance)
+            else:
+                sites = payload.get("sites") or self.all_sites()
+                out = await asyncio.to_thread(assign_families, located, sites, k, max_distance)
+            out["unassigned"] += [f.get("id") or f.get("family_id") for f in families if "lat" not in f]
+            return out
+
+        @self.on("update_site")
+        async def _update_site(payload: Dict[str, Any]):
+            site = payload.get("site") or {}
+            if not site.get("id"):
+                return {"ok": False, "error": "site.id is required"}
+            if payload.get("remove"):
+                self.remove_site(site["id"])
+            else:
+                self.upsert_site(site)
+            return {"ok": True, "site_id": site["id"]}
 
         @self.on("get_status")
         async def _status(payload: Dict[str, Any]):
             return {"status": "located", "programs": [], "sites": [], "next_steps": ["Schedule pickup"], "monthly_value": 0}
+
+    async def iter_sites(self, location: Dict[str, float], radius_miles: Optional[float] = None,
+                         meal_type: Optional[str] = None, yield_every: int = 256) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield matching sites nearest-first, lazily: distances are computed in one
+        pass but sites are only popped off the heap as the consumer asks for them.
+        """
+        has_loc = "lat" in (location or {}) and "lng" in (location or {})
+        overlay = self._iter_overlay(location if has_loc else None, radius_miles, meal_type)
+        if self.catalogue:
+            entries = heapq.merge(overlay, self._iter_catalogue(location if has_loc else None, radius_miles, meal_type))
+        else:
+            entries = overlay
+
+        popped = 0
+        for _, _, make_site, distance in entries:
+            site = make_site()
+            if distance is not None:
+                site["distance_miles"] = distance
+            yield site
+            popped += 1
+            if popped % yield_every == 0:
+                await asyncio.sleep(0)  # let other requests run during huge result sets
+
+    def _iter_overlay(self, location, radius_miles, meal_type):
+        heap = []
+        for site in self.sites:
+            if meal_type and meal_type not in site.get("meal_types", []):
+                continue
+            distance = None
+            if location and "lat" in site:
+                distance = round(haversine_miles(location["lat"], location["lng"], site["lat"], site["lng"]), 2)
+                if radius_miles is not None and distance > radius_miles:
+                    continue
+            heap.append((distance or 0.0, site["id"], lambda s=site: dict(s), distance))
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)
+
+    def _iter_catalogue(self, location, radius_miles, meal_type):
+        """Same (sort key, id, site factory, distance) entries, computed on the mapped columns."""
+        cat = self.catalogue
+        if location:
+            idx, dist = cat.nearby(location["lat"], location["lng"], radius_miles, meal_type)
+        else:
+            idx, dist = cat.by_id(meal_type), None
+        skip = self._removed | {s["id"] for s in self.sites}  # live edits win over the catalogue
+        for n, i in enumerate(idx.tolist()):
+            site_id = cat.site_id(i)
+            if site_id in skip:
+                continue
+            distance = None if dist is None else float(dist[n])
+            yield (distance or 0.0, site_id, lambda i=i: cat.site(i), distance)
+
+    def get_site(self, site_id: str) -> Optional[Dict[str, Any]]:
+        for site in self.sites:
+            if site["id"] == site_id:
+                return site
+        if self.catalogue and site_id not in self._removed:
+            i = self.catalogue.index_of(site_id)
+            if i is not None:
+                return self.catalogue.site(i)
+        return None
+
+    def all_sites(self) -> List[Dict[str, Any]]:
+        if not self.catalogue:
+            return self.sites
+        skip = self._removed | {s["id"] for s in self.sites}
+        return [s for s in self.catalogue if s["id"] not in skip] + self.sites
+
+    def upsert_site(self, site: Dict[str, Any]):
+        for i, existing in enumerate(self.sites):
+            if existing["id"] == site["id"]:
+                self.sites[i] = {**existing, **site}
+                self._notify(existing)  # old location
+                self._notify(self.sites[i])
+                return
+        existing = None if site["id"] in self._removed else self.get_site(site["id"])
+        self._removed.discard(site["id"])
+        if existing:  # first edit of a catalogue site
+            self.sites.append({**existing, **site})
+            self._notify(existing)
+            self._notify(self.sites[-1])
+            return
+        self.sites.append(dict(site))
+        self._notify(site)
+
+    def remove_site(self, site_id: str):
+        existing = self.get_site(site_id)
+        if existing is None:
+            return
+        self.sites = [s for s in self.sites if s["id"] != site_id]
+        if self.catalogue and self.catalogue.index_of(site_id) is not None:
+            self._removed.add(site_id)
+        self._notify(existing)
+
+    @staticmethod
+    def _open_catalogue(path: Optional[str]):
+        if not path:
+            return None
+        from site_catalogue import SiteCatalogue  # imported lazily: site_catalogue imports this package
+        try:
+            catalogue = SiteCatalogue.open(path)
+            logger.info("Loaded site catalogue %s (%d sites)", path, len(catalogue))
+            return catalogue
+        except Exception as e:
+            logger.error(f"Failed to open site catalogue {path}, using demo sites: {e}")
+            return None
+
+    def _notify(self, site: Dict[str, Any]):
+        for listener in self.site_listeners:
+            try:
+                listener(site)
+            except Exception as e:
+                logger.error("Site listener failed: %s", e)
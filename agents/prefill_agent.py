@@ -1,3 +1,102 @@
-class PrefillAgent:
-    async def handle(self, payload):
-        return {"ok": True}
+# agents/prefill_agent.py
+import os
+import asyncio
+import multiprocessing
+import hashlib
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+from .base_agent import BaseAgent
+from .prefill_forms import build_form, render_many
+
+logger = logging.getLogger(__name__)
+
+class PrefillAgent(BaseAgent):
+    """
+    Prefills the free/reduced-price meal application from intake + eligibility
+    data. Rendering (PDF/HTML) is CPU-bound, so it runs in a process pool and
+    never blocks the event loop. PREFILL_WORKERS=0 renders in a thread instead.
+    """
+    def __init__(self, max_documents: int = 5000):
+        super().__init__(agent_id="prefill")
+        workers = os.getenv("PREFILL_WORKERS")
+        self.workers = int(workers) if workers else (os.cpu_count() or 1)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.max_documents = max_documents
+        # family_id -> {"form": {...}, "owner_uid": str|None, "pdf": bytes, "html": bytes}; newest last
+        self.documents: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        @self.on("prefill_application")
+        async def _prefill(payload: Dict[str, Any]):
+            family_id = payload.get("family_id")
+            form = build_form(payload.get("family") or {}, payload.get("eligibility") or {})
+            rendered = (await self.render([form]))[0]
+            self._store(family_id, form, rendered, payload.get("owner_uid"))
+            return self._summary(family_id)
+
+        @self.on("prefill_bulk")
+        async def _bulk(payload: Dict[str, Any]):
+            items = payload.get("families", [])
+            forms = [build_form(i.get("family") or i, i.get("eligibility") or {}) for i in items]
+            rendered = await self.render(forms, chunk_size=payload.get("chunk_size", 64))
+            for item, form, docs in zip(items, forms, rendered):
+                self._store(item.get("family_id") or item.get("id"), form, docs, item.get("owner_uid"))
+            return {"status": "prefilled", "count": len(forms),
+                    "documents": [self._summary(i.get("family_id") or i.get("id")) for i in items]}
+
+        @self.on("get_status")
+        async def _status(payload: Dict[str, Any]):
+            doc = self.documents.get(payload.get("workflow_id"))
+            if not doc:
+                return {"programs": [], "sites": [], "next_steps": [], "monthly_value": 0}
+            return {"status": "prefilled", "programs": [], "sites": [],
+                    "next_steps": ["Review and sign your prefilled application"], "monthly_value": 0}
+
+    async def render(self, forms: List[Dict[str, Any]], chunk_size: int = 64) -> List[Dict[str, bytes]]:
+        """Render forms off the event loop, chunked to keep IPC overhead per form low."""
+        loop = asyncio.get_running_loop()
+        chunks = [forms[i:i + chunk_size] for i in range(0, len(forms), chunk_size)]
+        if self.workers <= 0:
+            results = await asyncio.gather(*(asyncio.to_thread(render_many, c) for c in chunks))
+        else:
+            pool = self._get_pool()
+            results = await asyncio.gather(*(loop.run_in_executor(pool, render_many, c) for c in chunks))
+        return [docs for chunk in results for docs in chunk]
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: the server process has gRPC/Firebase threads that don't survive fork
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _store(self, family_id: Optional[str], form: Dict[str, Any], docs: Dict[str, bytes],
+               owner_uid: Optional[str] = None):
+        if not family_id:
+            return
+        # owner_uid gates who may download the form (see get_prefilled_form)
+        self.documents[family_id] = {"form": form, "owner_uid": owner_uid, **docs}
+        self.documents.move_to_end(family_id)
+        while len(self.documents) > self.max_documents:
+            self.documents.popitem(last=False)
+
+    def _summary(self, family_id: Optional[str]) -> Dict[str, Any]:
+        doc = self.documents.get(family_id) or {}
+        form = doc.get("form") or {}
+        return {
+            "status": "prefilled",
+            "family_id": family_id,
+            "form_version": form.get("form_version"),
+            "language": form.get("language"),
+            "missing_fields": form.get("missing", []),
+            "formats": {
+                fmt: {"bytes": len(doc[fmt]), "sha256": hashlib.sha256(doc[fmt]).hexdigest()}
+                for fmt in ("pdf", "html") if fmt in doc
+            },
+        }
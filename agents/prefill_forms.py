@@ -0,0 +1,305 @@
+# agents/prefill_forms.py
+"""
+Free/reduced-price meal application: field mapping + rendering.
+
+Everything here is plain functions on plain dicts so it can run inside a
+process pool. Templates are compiled once per (language, format) per process
+and cached; a worker that renders 10k forms compiles each template once.
+"""
+import html
+import zlib
+from datetime import date
+from functools import lru_cache
+from string import Template
+from typing import Dict, Any, List, Tuple
+
+FORM_VERSION = "frp-2026-1"
+
+LABELS: Dict[str, Dict[str, str]] = {
+    "en": {
+        "title": "Application for Free and Reduced Price School Meals",
+        "section_household": "Household",
+        "section_children": "Children",
+        "section_assistance": "Assistance Programs",
+        "section_income": "Household Income",
+        "section_contact": "Contact",
+        "address": "Home address",
+        "school_name": "School",
+        "household_size": "Total household members",
+        "child": "Child",
+        "age": "age",
+        "programs": "Household receives",
+        "case_number": "Case number",
+        "annual_income": "Total annual income",
+        "email": "Email",
+        "phone": "Phone",
+        "language": "Preferred language",
+        "missing": "Still needed before you sign",
+        "none": "None",
+        "prepared": "Prepared",
+    },
+    "es": {
+        "title": "Solicitud de Comidas Escolares Gratuitas y a Precio Reducido",
+        "section_household": "Hogar",
+        "section_children": "Niños",
+        "section_assistance": "Programas de Asistencia",
+        "section_income": "Ingresos del Hogar",
+        "section_contact": "Contacto",
+        "address": "Dirección",
+        "school_name": "Escuela",
+        "household_size": "Total de miembros del hogar",
+        "child": "Niño",
+        "age": "edad",
+        "programs": "El hogar recibe",
+        "case_number": "Número de caso",
+        "annual_income": "Ingreso anual total",
+        "email": "Correo electrónico",
+        "phone": "Teléfono",
+        "language": "Idioma preferido",
+        "missing": "Falta antes de firmar",
+        "none": "Ninguno",
+        "prepared": "Preparado",
+    },
+}
+
+MISSING_LABELS = {
+    "en": {
+        "signature": "Adult household member signature",
+        "ssn_last4": "Last four digits of SSN (or check 'no SSN')",
+        "income": "Income for each household member",
+        "case_number": "SNAP/TANF case number",
+        "child_names": "Each child's full name",
+    },
+    "es": {
+        "signature": "Firma de un adulto del hogar",
+        "ssn_last4": "Últimos cuatro dígitos del SSN (o marque 'sin SSN')",
+        "income": "Ingresos de cada miembro del hogar",
+        "case_number": "Número de caso de SNAP/TANF",
+        "child_names": "Nombre completo de cada niño",
+    },
+}
+
+CATEGORICAL_PROGRAMS = ("snap", "tanf", "fdpir")
+
+
+def build_form(family: Dict[str, Any], eligibility: Dict[str, Any]) -> Dict[str, Any]:
+    """Map Family + eligibility data onto the application's fields."""
+    income_data = eligibility.get("income_data") or {}
+    programs = [p for p in CATEGORICAL_PROGRAMS if income_data.get(p) or p in (eligibility.get("eligible_programs") or [])]
+    case_number = eligibility.get("case_number")
+    income = income_data.get("household_income")
+    language = family.get("preferred_language") or "en"
+
+    missing = ["signature", "child_names"]
+    if programs:
+        # categorical eligibility: income and SSN sections are skipped on the real form
+        if not case_number:
+            missing.append("case_number")
+    else:
+        if income is None:
+            missing.append("income")
+        missing.append("ssn_last4")
+
+    return {
+        "form_version": FORM_VERSION,
+        "language": language if language in LABELS else "en",
+        "address": family.get("address", ""),
+        "school_name": family.get("school_name", ""),
+        "household_size": family.get("family_size") or len(family.get("children_ages") or []),
+        "children": [{"age": age} for age in family.get("children_ages") or []],
+        "programs": [p.upper() for p in programs],
+        "case_number": case_number or "",
+        "annual_income": None if programs or income is None else float(income),
+        "email": family.get("contact_email", ""),
+        "phone": family.get("contact_phone") or "",
+        "missing": missing,
+        "prepared_on": date.today().isoformat(),
+    }
+
+
+# ----- templates -----
+
+_HTML_SKELETON = """<!doctype html>
+<html lang="$lang"><head><meta charset="utf-8"><title>{title}</title>
+<style>body{{font-family:sans-serif;max-width:720px;margin:auto}}dt{{font-weight:bold}}
+.missing{{background:#fff4e5;padding:8px}}</style></head><body>
+<h1>{title}</h1>
+<h2>{section_household}</h2><dl>
+<dt>{address}</dt><dd>$address</dd>
+<dt>{school_name}</dt><dd>$school_name</dd>
+<dt>{household_size}</dt><dd>$household_size</dd></dl>
+<h2>{section_children}</h2><ul>$children</ul>
+<h2>{section_assistance}</h2><dl>
+<dt>{programs}</dt><dd>$programs</dd>
+<dt>{case_number}</dt><dd>$case_number</dd></dl>
+<h2>{section_income}</h2><dl><dt>{annual_income}</dt><dd>$annual_income</dd></dl>
+<h2>{section_contact}</h2><dl>
+<dt>{email}</dt><dd>$email</dd><dt>{phone}</dt><dd>$phone</dd></dl>
+<div class="missing"><strong>{missing}</strong><ul>$missing</ul></div>
+<p><small>{prepared} $prepared_on &middot; $form_version</small></p>
+</body></html>
+"""
+
+_TEXT_SKELETON = """{title}
+
+{section_household}
+  {address}: $address
+  {school_name}: $school_name
+  {household_size}: $household_size
+
+{section_children}
+$children
+{section_assistance}
+  {programs}: $programs
+  {case_number}: $case_number
+
+{section_income}
+  {annual_income}: $annual_income
+
+{section_contact}
+  {email}: $email
+  {phone}: $phone
+
+{missing}:
+$missing
+{prepared} $prepared_on - $form_version
+"""
+
+
+@lru_cache(maxsize=None)
+def compiled_template(language: str, fmt: str) -> Tuple[Template, Dict[str, str]]:
+    """Labels are baked into the skeleton once; only field values are substituted per form."""
+    labels = LABELS.get(language, LABELS["en"])
+    if fmt == "html":
+        escaped = {k: html.escape(v) for k, v in labels.items()}
+        return Template(_HTML_SKELETON.format(**escaped)), labels
+    return Template(_TEXT_SKELETON.format(**labels)), labels
+
+
+def _values(form: Dict[str, Any], labels: Dict[str, str], fmt: str) -> Dict[str, str]:
+    lang = form["language"]
+    missing = [MISSING_LABELS.get(lang, MISSING_LABELS["en"])[m] for m in form["missing"]]
+    children = [f"{labels['child']} {i} ({labels['age']} {c['age']})" for i, c in enumerate(form["children"], 1)]
+    income = form["annual_income"]
+    raw = {
+        "lang": lang,
+        "address": form["address"],
+        "school_name": form["school_name"],
+        "household_size": str(form["household_size"]),
+        "programs": ", ".join(form["programs"]) or labels["none"],
+        "case_number": form["case_number"] or "-",
+        "annual_income": "-" if income is None else f"${income:,.2f}",
+        "email": form["email"],
+        "phone": form["phone"] or "-",
+        "prepared_on": form["prepared_on"],
+        "form_version": form["form_version"],
+    }
+    if fmt == "html":
+        out = {k: html.escape(v) for k, v in raw.items()}
+        out["children"] = "".join(f"<li>{html.escape(c)}</li>" for c in children)
+        out["missing"] = "".join(f"<li>{html.escape(m)}</li>" for m in missing)
+        return out
+    raw["children"] = "".join(f"  {c}\n" for c in children)
+    raw["missing"] = "".join(f"  - {m}\n" for m in missing)
+    return raw
+
+
+def _pdf_escape(line: str) -> bytes:
+    data = line.encode("latin-1", "replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+# US Letter, in points: this is a US federal form
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN, FONT_SIZE, LEADING = 50, 11, 14
+TOP = PAGE_HEIGHT - 52
+LINES_PER_PAGE = (TOP - MARGIN) // LEADING + 1
+
+# approximate Helvetica advance widths (em); rounded up so wrapped lines never overrun
+_NARROW = set("ijlftrI.,:;'!|()[] ")
+
+
+def _char_width(ch: str) -> float:
+    if ch in _NARROW:
+        return 0.333
+    if ch in "MWmw@%":
+        return 0.944
+    if ch.isupper():
+        return 0.722
+    return 0.556
+
+
+def _wrap(line: str, width: float) -> List[str]:
+    """Greedy word wrap by estimated width; continuation lines keep the indent, plus two spaces."""
+    indent = line[:len(line) - len(line.lstrip())]
+    em = lambda text: FONT_SIZE * sum(_char_width(ch) for ch in text)
+    if em(line) <= width:
+        return [line]
+    out, current = [], indent
+    for word in line.split():
+        candidate = f"{current} {word}" if current.strip() else current + word
+        if em(candidate) <= width:
+            current = candidate
+            continue
+        if current.strip():
+            out.append(current)
+            current = indent + "  "
+        while em(current + word) > width:  # a single word wider than the page
+            cut = len(word) - 1
+            while cut > 1 and em(current + word[:cut]) > width:
+                cut -= 1
+            out.append(current + word[:cut])
+            word = word[cut:]
+        current += word
+    if current.strip():
+        out.append(current)
+    return out
+
+
+def _text_to_pdf(text: str) -> bytes:
+    """Minimal single-font PDF (Helvetica, WinAnsi) on US Letter; long lines wrap at the margin."""
+    width = PAGE_WIDTH - 2 * MARGIN
+    lines = [wrapped for line in text.splitlines() for wrapped in _wrap(line, width)]
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    n_pages = len(pages)
+    # object ids: 1 catalog, 2 pages, 3 font, then (page, content) pairs
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(n_pages))
+        + b"] /Count %d >>" % n_pages,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, page in enumerate(pages):
+        body = b"BT /F1 %d Tf %d TL %d %d Td " % (FONT_SIZE, LEADING, MARGIN, TOP) + b"".join(b"(" + _pdf_escape(l) + b") Tj T* " for l in page) + b"ET"
+        stream = zlib.compress(body)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT, 5 + 2 * i)
+        )
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def render_form(form: Dict[str, Any], fmt: str = "pdf") -> bytes:
+    """Render one prefilled form to "html" or "pdf" bytes. CPU-bound; run it in a process pool."""
+    tmpl_fmt = "html" if fmt == "html" else "text"
+    template, labels = compiled_template(form["language"], tmpl_fmt)
+    text = template.substitute(_values(form, labels, tmpl_fmt))
+    if fmt == "html":
+        return text.encode("utf-8")
+    return _text_to_pdf(text)
+
+
+def render_many(forms: List[Dict[str, Any]], formats: Tuple[str, ...] = ("pdf", "html")) -> List[Dict[str, bytes]]:
+    """Batch entry point for the pool: one IPC round trip per chunk instead of per form."""
+    return [{fmt: render_form(form, fmt) for fmt in formats} for form in forms]
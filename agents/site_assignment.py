@@ -0,0 +1,269 @@
+# agents/site_assignment.py
+"""
+Batch assignment of families to meal sites under daily capacity.
+
+Distances are computed in chunks (families x sites) so memory stays bounded
+no matter how large the district is; only each family's k nearest feasible
+sites are kept. The assignment itself is a vectorized greedy: every round,
+each unassigned family proposes to its next-best candidate and each site
+accepts the closest proposals that still fit its remaining capacity. Families
+left over after k rounds are repaired against the sites that still have room.
+"""
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Sequence, Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_MILES = 3958.8
+MEAL_TYPES = ("breakfast", "lunch", "supper", "snacks")
+ACCESSIBILITY = ("wheelchair", "parking", "transit", "stroller", "interpreter")
+
+
+def encode_masks(labels: Sequence[Sequence[str]], vocab: Sequence[str]) -> np.ndarray:
+    """List of label lists -> uint32 bitmask per row (bit i = vocab[i])."""
+    if len(vocab) > 32:
+        raise ValueError("at most 32 labels per bitmask")
+    bit = {name: 1 << i for i, name in enumerate(vocab)}
+    return np.fromiter(
+        (sum(bit[x] for x in set(row or ()) if x in bit) for row in labels),
+        dtype=np.uint32, count=len(labels),
+    )
+
+
+def extend_vocab(base: Sequence[str], *label_lists: Sequence[Sequence[str]]) -> List[str]:
+    """Base vocabulary plus any extra labels seen, so unknown needs stay unsatisfiable instead of ignored."""
+    vocab = list(base)
+    seen = set(vocab)
+    for rows in label_lists:
+        for row in rows:
+            for x in row or ():
+                if x not in seen:
+                    seen.add(x)
+                    vocab.append(x)
+    return vocab
+
+
+@dataclass
+class AssignmentResult:
+    site_index: np.ndarray       # int32 per family, -1 = unassigned
+    distance_miles: np.ndarray   # float32 per family, inf = unassigned
+    remaining_capacity: np.ndarray
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def unassigned(self) -> np.ndarray:
+        return np.flatnonzero(self.site_index < 0)
+
+
+def unit_vectors(lat, lng) -> np.ndarray:
+    """
+    Degrees -> points on the unit sphere. Nearest by great-circle = largest dot product.
+    Kept in float64: float32 dots near 1.0 can't resolve distances under a mile or so.
+    """
+    la = np.radians(np.asarray(lat, dtype=np.float64))
+    lo = np.radians(np.asarray(lng, dtype=np.float64))
+    return np.stack([np.cos(la) * np.cos(lo), np.cos(la) * np.sin(lo), np.sin(la)], axis=1)
+
+
+def dot_to_miles(dot: np.ndarray) -> np.ndarray:
+    chord = np.sqrt(np.clip(2.0 - 2.0 * dot, 0.0, 4.0))
+    return (2 * EARTH_RADIUS_MILES * np.arcsin(chord / 2)).astype(np.float32)
+
+
+class SiteAssigner:
+    """
+    Holds the site side of the problem (coordinates, capacity, masks) so
+    several districts / re-runs can reuse it.
+    """
+    def __init__(self, lat, lng, capacity, meal_mask, access_mask,
+                 k: int = 8, max_matrix_elements: int = 4_000_000):
+        self.xyz = unit_vectors(lat, lng)
+        self.capacity = np.asarray(capacity, dtype=np.int64)
+        self.meal_mask = np.asarray(meal_mask, dtype=np.uint32)
+        self.access_mask = np.asarray(access_mask, dtype=np.uint32)
+        self.k = max(1, k)
+        self.max_matrix_elements = max_matrix_elements
+
+    def _candidates(self, fxyz, meal_need, access_need, fam_idx, site_idx, k, max_distance):
+        """k nearest feasible sites among site_idx for each family in fam_idx, sorted by distance."""
+        k = min(k, len(site_idx))
+        cand = np.zeros((len(fam_idx), k), dtype=np.int32)
+        cdist = np.full((len(fam_idx), k), np.inf, dtype=np.float32)
+        min_dot = None if max_distance is None else np.float32(np.cos(max_distance / EARTH_RADIUS_MILES))
+
+        # families with identical needs share one feasible-site subset
+        need_key = (meal_need[fam_idx].astype(np.uint64) << np.uint64(32)) | access_need[fam_idx]
+        keys, group = np.unique(need_key, return_inverse=True)
+        for g, key in enumerate(keys):
+            positions = np.flatnonzero(group == g)
+            meal, access = np.uint32(int(key) >> 32), np.uint32(int(key) & 0xFFFFFFFF)
+            feasible = site_idx[((self.meal_mask[site_idx] & meal) == meal)
+                                & ((self.access_mask[site_idx] & access) == access)]
+            if not len(feasible):
+                continue
+            sxyz_t = np.ascontiguousarray(self.xyz[feasible].T)
+            kk = min(k, len(feasible))
+            step = max(1, self.max_matrix_elements // len(feasible))
+
+            for start in range(0, len(positions), step):
+                pos = positions[start:start + step]
+                dots = fxyz[fam_idx[pos]] @ sxyz_t     # (rows x feasible), one BLAS call
+                if kk < dots.shape[1]:
+                    part = np.argpartition(dots, dots.shape[1] - kk, axis=1)[:, -kk:]
+                else:
+                    part = np.broadcast_to(np.arange(dots.shape[1]), dots.shape).copy()
+                pdot = np.take_along_axis(dots, part, axis=1)
+                del dots
+                order = np.argsort(-pdot, axis=1, kind="stable")
+                pdot = np.take_along_axis(pdot, order, axis=1)
+                d = dot_to_miles(pdot)
+                if min_dot is not None:
+                    d[pdot < min_dot] = np.inf
+                cand[pos, :kk] = feasible[np.take_along_axis(part, order, axis=1)]
+                cdist[pos, :kk] = d
+        return cand, cdist
+
+    @staticmethod
+    def _propose_rounds(cand, cdist, fam_idx, demand, assigned, dist_out, remaining) -> int:
+        """Rows of cand/cdist line up with fam_idx."""
+        ptr = np.zeros(len(fam_idx), dtype=np.int32)
+        active = np.arange(len(fam_idx))
+        rounds = 0
+        while len(active):
+            rounds += 1
+            p = ptr[active]
+            cost = cdist[active, p]
+            live = np.isfinite(cost)          # candidates are sorted: inf means nothing left
+            active, p, cost = active[live], p[live], cost[live]
+            if not len(active):
+                break
+            site = cand[active, p]
+            d = demand[fam_idx[active]]
+
+            order = np.lexsort((cost, site))  # by site, then distance
+            s_sorted = site[order]
+            cum = np.cumsum(d[order])
+            first = np.r_[True, s_sorted[1:] != s_sorted[:-1]]
+            group_start = np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+            before = np.where(group_start > 0, cum[group_start - 1], 0)
+            accept_sorted = (cum - before) <= remaining[s_sorted]
+
+            accept = np.empty_like(accept_sorted)
+            accept[order] = accept_sorted
+            won = fam_idx[active[accept]]
+            assigned[won] = site[accept]
+            dist_out[won] = cost[accept]
+            remaining -= np.bincount(site[accept], weights=d[accept], minlength=len(remaining)).astype(np.int64)
+
+            lost = active[~accept]
+            ptr[lost] += 1
+            active = lost[ptr[lost] < cand.shape[1]]
+        return rounds
+
+    def assign(self, lat, lng, meal_need, access_need, demand=None,
+               max_distance: Optional[float] = None, repair_passes: int = 6,
+               max_k: int = 512) -> AssignmentResult:
+        """
+        Each repair pass only looks at sites that still have room, with a
+        candidate list twice as long as the previous pass (up to max_k).
+        """
+        t0 = time.perf_counter()
+        n = len(lat)
+        fxyz = unit_vectors(lat, lng)
+        meal_need = np.asarray(meal_need, dtype=np.uint32)
+        access_need = np.asarray(access_need, dtype=np.uint32)
+        demand = np.ones(n, dtype=np.int64) if demand is None else np.asarray(demand, dtype=np.int64)
+
+        assigned = np.full(n, -1, dtype=np.int32)
+        dist_out = np.full(n, np.inf, dtype=np.float32)
+        remaining = self.capacity.copy()
+
+        todo = np.arange(n)
+        all_sites = np.arange(len(remaining))
+        rounds = passes = 0
+        k = self.k
+        while len(todo) and passes <= repair_passes:
+            open_sites = all_sites[remaining > 0]
+            if not len(open_sites):
+                break
+            cand, cdist = self._candidates(fxyz, meal_need, access_need, todo, open_sites, k, max_distance)
+            rounds += self._propose_rounds(cand, cdist, todo, demand, assigned, dist_out, remaining)
+            del cand, cdist
+            left = todo[assigned[todo] < 0]
+            if len(left) == len(todo):
+                break  # no progress: remaining families can't be served
+            todo = left
+            passes += 1
+            k = min(k * 2, max_k)
+
+        stats = {
+            "families": n,
+            "sites": len(remaining),
+            "assigned": int((assigned >= 0).sum()),
+            "unassigned": int((assigned < 0).sum()),
+            "rounds": rounds,
+            "repair_passes": max(0, passes - 1),
+            "elapsed_s": round(time.perf_counter() - t0, 3),
+        }
+        return AssignmentResult(assigned, dist_out, remaining, stats)
+
+
+def family_demand(family: Dict[str, Any]) -> int:
+    """Meals per day a family needs from one site: one per child, else household size."""
+    if family.get("demand"):
+        return int(family["demand"])
+    return max(1, len(family.get("children_ages") or []) or int(family.get("family_size") or 1))
+
+
+def assign_families(families: List[Dict[str, Any]], sites: List[Dict[str, Any]],
+                    k: int = 8, max_distance: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Dict-in / dict-out wrapper used by LocatorAgent. Families need "lat"/"lng";
+    sites need "lat"/"lng" and "daily_capacity".
+    """
+    meal_vocab = extend_vocab(MEAL_TYPES, [s.get("meal_types") for s in sites], [f.get("meal_types") for f in families])
+    access_vocab = extend_vocab(ACCESSIBILITY, [s.get("accessibility") for s in sites], [f.get("accessibility") for f in families])
+
+    assigner = SiteAssigner(
+        lat=[s["lat"] for s in sites],
+        lng=[s["lng"] for s in sites],
+        capacity=[int(s.get("daily_capacity", 0)) for s in sites],
+        meal_mask=encode_masks([s.get("meal_types") for s in sites], meal_vocab),
+        access_mask=encode_masks([s.get("accessibility") for s in sites], access_vocab),
+        k=k,
+    )
+    return assign_with(assigner, families, lambda i: sites[i]["id"], meal_vocab, access_vocab, max_distance)
+
+
+def assign_with(assigner: SiteAssigner, families: List[Dict[str, Any]], site_id: Callable[[int], str],
+                meal_vocab: Sequence[str], access_vocab: Sequence[str],
+                max_distance: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run a prepared assigner over family dicts. site_id maps a site index back to
+    its id; the vocabularies must be the ones the assigner's masks were built with
+    (extra family-only labels at the end are fine, no site will satisfy them).
+    """
+    result = assigner.assign(
+        lat=[f["lat"] for f in families],
+        lng=[f["lng"] for f in families],
+        meal_need=encode_masks([f.get("meal_types") for f in families], meal_vocab),
+        access_need=encode_masks([f.get("accessibility") for f in families], access_vocab),
+        demand=[family_demand(f) for f in families],
+        max_distance=max_distance,
+    )
+
+    assignments, unassigned = [], []
+    for fam, idx, dist in zip(families, result.site_index.tolist(), result.distance_miles.tolist()):
+        if idx < 0:
+            unassigned.append(fam.get("id") or fam.get("family_id"))
+        else:
+            assignments.append({
+                "family_id": fam.get("id") or fam.get("family_id"),
+                "site_id": site_id(idx),
+                "distance_miles": round(dist, 2),
+            })
+    return {"assignments": assignments, "unassigned": unassigned, "stats": result.stats}
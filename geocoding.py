@@ -0,0 +1,363 @@
+# geocoding.py
+"""
+Address normalization + geocoding with a persistent on-disk cache.
+
+Families living in the same apartment complex or shelter type the same
+address in many slightly different ways ("123 Main Street Apt 4",
+"123 main st #12"). We canonicalize the address, drop the unit number for
+the lookup key (all units share one rooftop), and keep results in a small
+SQLite key-value store so each building costs one Maps API call.
+"""
+import os
+import re
+import math
+import time
+import sqlite3
+import hashlib
+import asyncio
+import logging
+import threading
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Iterable, Tuple
+
+from http_client import HttpClient, get_http
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_PATH = "/maps/api/geocode/json"  # on the "maps" dependency in http_client
+EARTH_RADIUS_MILES = 3958.8
+
+# USPS-style suffix / directional abbreviations
+_ABBREVIATIONS = {
+    "STREET": "ST", "AVENUE": "AVE", "AV": "AVE", "ROAD": "RD", "BOULEVARD": "BLVD",
+    "DRIVE": "DR", "LANE": "LN", "COURT": "CT", "PLACE": "PL", "TERRACE": "TER",
+    "PARKWAY": "PKWY", "HIGHWAY": "HWY", "CIRCLE": "CIR", "SQUARE": "SQ",
+    "TRAIL": "TRL", "EXPRESSWAY": "EXPY", "FREEWAY": "FWY", "MOUNT": "MT",
+    "NORTH": "N", "SOUTH": "S", "EAST": "E", "WEST": "W",
+    "NORTHEAST": "NE", "NORTHWEST": "NW", "SOUTHEAST": "SE", "SOUTHWEST": "SW",
+}
+_UNIT_WORDS = {
+    "APARTMENT": "APT", "APT": "APT", "UNIT": "UNIT", "SUITE": "STE", "STE": "STE",
+    "ROOM": "RM", "RM": "RM", "FLOOR": "FL", "BUILDING": "BLDG",
+    "BLDG": "BLDG", "LOT": "LOT", "SPACE": "SPC", "SPC": "SPC",
+}  # no bare "FL": it collides with the Florida state code
+_UNIT_RE = re.compile(
+    r"(?:\b(?P<word>" + "|".join(_UNIT_WORDS) + r")\b\.?\s*#?\s*|#\s*)(?P<num>[A-Z0-9-]+)"
+)
+_STREET_SUFFIXES = {
+    "ST", "AVE", "RD", "BLVD", "DR", "LN", "CT", "PL", "TER", "PKWY", "HWY", "CIR", "SQ",
+    "TRL", "EXPY", "FWY", "WAY", "LOOP", "ROW", "PLZ", "XING", "PIKE", "ALY", "WALK", "PATH",
+}
+_DIRECTIONALS = {"N", "S", "E", "W", "NE", "NW", "SE", "SW"}
+
+
+@dataclass
+class GeocodeResult:
+    lat: float
+    lng: float
+    formatted_address: str = ""
+    source: str = "maps"
+
+    def as_location(self) -> Dict[str, float]:
+        return {"lat": self.lat, "lng": self.lng}
+
+
+def _find_unit(text: str) -> Optional["re.Match"]:
+    """
+    Unit words also show up in street names ("10 Lot Rd", "5 Outer Space Way"),
+    so a worded designator only counts after a street suffix (directionals
+    allowed in between) or at the very end, and its number has to look like one.
+    "#12" is always a unit.
+    """
+    for m in _UNIT_RE.finditer(text):
+        if not m.group("word"):
+            return m
+        num = m.group("num")
+        if len(num) > 1 and not any(c.isdigit() for c in num):
+            continue
+        before = text[:m.start()].split()
+        while before and _ABBREVIATIONS.get(before[-1], before[-1]) in _DIRECTIONALS:
+            before.pop()
+        if (before and _ABBREVIATIONS.get(before[-1], before[-1]) in _STREET_SUFFIXES) or m.end() == len(text):
+            return m
+    return None
+
+
+def split_unit(address: str) -> Tuple[str, Optional[str]]:
+    """Canonicalize an address and split off its unit designator.
+
+    Returns (building, unit) where unit is e.g. "APT 4B" or None.
+    """
+    text = (address or "").upper()
+    text = re.sub(r"[^\w#\s-]", " ", text)  # commas, periods, etc.
+    text = re.sub(r"\s+", " ", text).strip()
+
+    unit = None
+    m = _find_unit(text)
+    if m:
+        word = _UNIT_WORDS.get(m.group("word") or "", "#")
+        unit = f"{word} {m.group('num')}"
+        text = (text[:m.start()] + " " + text[m.end():]).strip()
+        text = re.sub(r"\s+", " ", text)
+
+    words = [_ABBREVIATIONS.get(w, w) for w in text.split(" ") if w]
+    return " ".join(words), unit
+
+
+def normalize_address(address: str) -> str:
+    """Full canonical form, unit included (for display / storage)."""
+    building, unit = split_unit(address)
+    return f"{building} {unit}" if unit else building
+
+
+def geocode_key(address: str) -> str:
+    """Cache key for an address: canonical building address, unit dropped."""
+    return split_unit(address)[0]
+
+
+def haversine_miles(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+class GeocodeCache:
+    """
+    Persistent key-value store (SQLite) with LRU eviction.
+    Not-found results are cached too so bad addresses aren't retried on every intake.
+    """
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = path
+        # GeocodingService calls in from worker threads (asyncio.to_thread); one writer at a time
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocodes ("
+            " key TEXT PRIMARY KEY, lat REAL, lng REAL, formatted TEXT,"
+            " source TEXT, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS geocodes_lru ON geocodes(last_used)")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+
+    def get_many(self, keys: Iterable[str], source: str = "maps") -> Dict[str, Optional[GeocodeResult]]:
+        """
+        Return cached entries (a value of None means 'cached as not found') that
+        came from the given geocoder; fake coordinates never pass for real ones. Blocking.
+        """
+        with self._lock:
+            return self._get_many(list(keys), source)
+
+    def _get_many(self, keys: List[str], source: str) -> Dict[str, Optional[GeocodeResult]]:
+        found: Dict[str, Optional[GeocodeResult]] = {}
+        if not keys:
+            return found
+        for i in range(0, len(keys), 500):  # stay under SQLite's parameter limit
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT key, lat, lng, formatted FROM geocodes WHERE source=? AND key IN ({marks})",
+                [source, *chunk],
+            ).fetchall()
+            for key, lat, lng, formatted in rows:
+                found[key] = None if lat is None else GeocodeResult(lat, lng, formatted or "", source)
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE geocodes SET last_used=? WHERE key=?", [(now, k) for k in found]
+            )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, Optional[GeocodeResult]], source: str = "maps"):
+        """Blocking; commits. source is recorded for not-found entries too."""
+        if not items:
+            return
+        with self._lock:
+            self._put_many(items, source)
+
+    def _put_many(self, items: Dict[str, Optional[GeocodeResult]], source: str):
+        now = time.time()
+        rows = [
+            (k, r.lat if r else None, r.lng if r else None,
+             r.formatted_address if r else None, source, now)
+            for k, r in items.items()
+        ]
+        self._conn.executemany("INSERT OR REPLACE INTO geocodes VALUES (?,?,?,?,?,?)", rows)
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        excess = self._count() - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM geocodes WHERE key IN "
+                "(SELECT key FROM geocodes ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FakeGeocoder:
+    """
+    Deterministic local geocoder for tests and keyless local dev.
+    Same key -> same point, scattered within ~10 miles of `center`.
+    """
+    source = "fake"
+
+    def __init__(self, center: Tuple[float, float] = (41.8781, -87.6298), delay: float = 0.0):
+        self.center = center
+        self.delay = delay  # simulated API latency, for tests
+        self.calls: List[List[str]] = []
+
+    async def geocode_batch(self, keys: List[str]) -> Dict[str, Optional[GeocodeResult]]:
+        self.calls.append(list(keys))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        out = {}
+        for key in keys:
+            h = hashlib.sha1(key.encode()).digest()
+            dlat = (int.from_bytes(h[:4], "big") / 2**32 - 0.5) * 0.3
+            dlng = (int.from_bytes(h[4:8], "big") / 2**32 - 0.5) * 0.3
+            out[key] = GeocodeResult(self.center[0] + dlat, self.center[1] + dlng, key, self.source)
+        return out
+
+
+class MapsGeocoder:
+    """Google Geocoding API. It has no batch endpoint, so misses fan out with bounded concurrency."""
+    source = "maps"
+
+    def __init__(self, api_key: str, concurrency: int = 8, http: Optional[HttpClient] = None):
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self._http = http
+
+    @property
+    def http(self) -> HttpClient:
+        return self._http or get_http()
+
+    async def geocode_batch(self, keys: List[str]) -> Dict[str, Optional[GeocodeResult]]:
+        sem = asyncio.Semaphore(self.concurrency)
+        out: Dict[str, Optional[GeocodeResult]] = {}
+
+        async def one(key: str):
+            async with sem:
+                try:
+                    # pooled, circuit-broken and hedged by the shared client
+                    r = await self.http.get("maps", GEOCODE_PATH, params={"address": key, "key": self.api_key})
+                    r.raise_for_status()
+                    data = r.json()
+                except Exception as e:
+                    # transient failure: leave it out so it isn't cached as not-found
+                    logger.warning("Geocode failed for %r: %s", key, e)
+                    return
+                results = data.get("results") or []
+                if data.get("status") == "ZERO_RESULTS" or not results:
+                    out[key] = None
+                    return
+                loc = results[0]["geometry"]["location"]
+                out[key] = GeocodeResult(loc["lat"], loc["lng"], results[0].get("formatted_address", ""), self.source)
+
+        await asyncio.gather(*(one(k) for k in keys))
+        return out
+
+
+class GeocodingService:
+    """
+    Cache-first geocoding. Concurrent lookups of the same building share a
+    single in-flight request; cache misses are sent to the geocoder as one batch.
+    """
+    def __init__(self, geocoder, cache: GeocodeCache):
+        self.geocoder = geocoder
+        self.cache = cache
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    @classmethod
+    def from_env(cls, maps_api_key: Optional[str] = None) -> "GeocodingService":
+        path = os.getenv("GEOCODE_CACHE_PATH") or os.path.join(tempfile.gettempdir(), "mealsync_geocode.sqlite3")
+        max_entries = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "200000"))
+        if os.getenv("GEOCODER", "").lower() == "fake":
+            geocoder = FakeGeocoder()
+        elif not maps_api_key:
+            logger.warning("MAPS_API_KEY not set; geocoding with FakeGeocoder (coordinates are not real)")
+            geocoder = FakeGeocoder()
+        else:
+            geocoder = MapsGeocoder(maps_api_key)
+        return cls(geocoder, GeocodeCache(path, max_entries))
+
+    async def geocode(self, address: str) -> Optional[GeocodeResult]:
+        return (await self.geocode_many([address]))[0]
+
+    async def geocode_many(self, addresses: List[str]) -> List[Optional[GeocodeResult]]:
+        keys = [geocode_key(a) for a in addresses]
+        unique = [k for k in dict.fromkeys(keys) if k]
+        results: Dict[str, Optional[GeocodeResult]] = {}
+
+        # SQLite reads / LRU touches commit; keep them off the event loop
+        cached = await asyncio.to_thread(self.cache.get_many, unique, self.geocoder.source) if unique else {}
+        results.update(cached)
+        self.stats["hits"] += len(cached)
+
+        waiting, mine = {}, []
+        for key in unique:
+            if key in cached:
+                continue
+            if key in self._inflight:
+                waiting[key] = self._inflight[key]
+                self.stats["coalesced"] += 1
+            else:
+                self._inflight[key] = asyncio.get_running_loop().create_future()
+                mine.append(key)
+
+        if mine:
+            self.stats["misses"] += len(mine)
+            fetched: Dict[str, Optional[GeocodeResult]] = {}
+            done = False
+            try:
+                fetched = await self.geocoder.geocode_batch(mine)
+                done = True
+                await asyncio.to_thread(self.cache.put_many, fetched, self.geocoder.source)
+            except Exception as e:
+                logger.error("Geocoder batch failed: %s", e)
+                done = True
+            finally:
+                # also runs on cancellation (client went away): never leave waiters hanging
+                for key in mine:
+                    fut = self._inflight.pop(key)
+                    if fut.done():
+                        continue
+                    if done:
+                        fut.set_result(fetched.get(key))
+                    else:
+                        fut.cancel()  # waiters retry the lookup themselves
+            for key in mine:
+                results[key] = fetched.get(key)
+
+        for key, fut in waiting.items():
+            try:
+                # shielded so one waiter being cancelled doesn't cancel the shared lookup
+                results[key] = await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise  # we were cancelled ourselves
+                results[key] = (await self.geocode_many([key]))[0]
+
+        return [results.get(k) if k else None for k in keys]
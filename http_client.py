@@ -0,0 +1,271 @@
+# http_client.py
+"""
+Shared outbound HTTP layer for external APIs (Maps, Calendar, FCM, Gemini).
+
+- one pooled httpx.AsyncClient per dependency (= per host), HTTP/2 when h2 is installed
+- per-dependency timeouts; the total time for a call, hedges included, is bounded
+- a circuit breaker per dependency, so an outage fails fast instead of
+  tying up request coroutines until they time out
+- optional hedging for idempotent reads: if the first GET hasn't answered
+  after hedge_after seconds, a second one is sent and the first answer wins
+- latency / error / hedge metrics for /api/metrics
+
+Agents go through get_http(). Tests swap it with set_http(HttpClient(transport=httpx.MockTransport(...)))
+or point a dependency at a local fake server with HTTP_<NAME>_BASE_URL.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is importable)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class CircuitOpenError(Exception):
+    """Raised without touching the network while a dependency's breaker is open."""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"Circuit open for {dependency}; retry in {retry_after:.1f}s")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+@dataclass
+class Dependency:
+    name: str
+    base_url: str
+    timeout: float = 5.0              # total seconds per call, hedges included
+    connect_timeout: float = 2.0
+    max_connections: int = 20
+    max_keepalive: int = 10
+    failure_threshold: int = 5        # consecutive failures before the breaker opens
+    reset_timeout: float = 30.0       # seconds open before a single probe is let through
+    hedge_after: Optional[float] = None  # seconds; None = no hedging
+
+
+DEFAULT_DEPENDENCIES = (
+    Dependency("maps", "https://maps.googleapis.com", timeout=5.0, hedge_after=0.3),
+    Dependency("calendar", "https://www.googleapis.com", timeout=10.0),
+    Dependency("fcm", "https://fcm.googleapis.com", timeout=10.0),
+    Dependency("gemini", "https://generativelanguage.googleapis.com", timeout=30.0, max_connections=10),
+)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_request(self) -> bool:
+        """Raises CircuitOpenError or lets the call through; True if the call is the half-open probe."""
+        if self.state == "closed":
+            return False
+        waited = time.monotonic() - self.opened_at
+        if self.state == "open" and waited >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True  # exactly one probe; everyone else still fails fast
+            return True
+        raise CircuitOpenError(self.name, max(0.0, self.reset_timeout - waited))
+
+    def record_success(self):
+        self.state, self.failures, self._probing = "closed", 0, False
+
+    def release_probe(self):
+        """The probe was abandoned without an answer either way; let the next call probe."""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("Circuit for %s opened after %d failures", self.name, self.failures)
+            self.state, self.opened_at = "open", time.monotonic()
+
+
+class LatencyStats:
+    def __init__(self, window: int = 1024):
+        self.samples: deque = deque(maxlen=window)  # ms, most recent calls
+        self.counts = {"requests": 0, "errors": 0, "short_circuited": 0, "hedged": 0, "hedge_wins": 0}
+
+    def observe(self, ms: float):
+        self.samples.append(ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> Optional[float]:
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else None
+
+        return {**self.counts, "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+
+
+def _is_failure(response: httpx.Response) -> bool:
+    # 4xx is the caller's problem, not the dependency's; 429 means back off
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class HttpClient:
+    def __init__(self, dependencies=DEFAULT_DEPENDENCIES,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport
+        self.dependencies: Dict[str, Dependency] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stats: Dict[str, LatencyStats] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        for dep in dependencies:
+            self.register(dep)
+
+    def register(self, dep: Dependency):
+        """Add or replace a dependency. HTTP_<NAME>_BASE_URL overrides its base URL (fake servers)."""
+        dep.base_url = os.getenv(f"HTTP_{dep.name.upper()}_BASE_URL") or dep.base_url
+        self.dependencies[dep.name] = dep
+        self.breakers[dep.name] = CircuitBreaker(dep.name, dep.failure_threshold, dep.reset_timeout)
+        self.stats.setdefault(dep.name, LatencyStats())
+        old = self._clients.pop(dep.name, None)
+        if old is not None:
+            asyncio.ensure_future(old.aclose())
+
+    def _client(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None:
+            dep = self.dependencies[name]
+            client = self._clients[name] = httpx.AsyncClient(
+                base_url=dep.base_url,
+                timeout=httpx.Timeout(dep.timeout, connect=dep.connect_timeout),
+                limits=httpx.Limits(max_connections=dep.max_connections,
+                                    max_keepalive_connections=dep.max_keepalive,
+                                    keepalive_expiry=60.0),
+                http2=HTTP2_AVAILABLE and self.transport is None,
+                transport=self.transport,
+            )
+        return client
+
+    async def request(self, dependency: str, method: str, url: str, *,
+                      hedge: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """
+        Send a request to a registered dependency. url may be relative to its base URL.
+        Raises CircuitOpenError, httpx.TimeoutException or whatever the transport raised;
+        HTTP error statuses are returned, not raised.
+        """
+        dep = self.dependencies[dependency]
+        breaker, stats = self.breakers[dependency], self.stats[dependency]
+        method = method.upper()
+        try:
+            is_probe = breaker.before_request()
+        except CircuitOpenError:
+            stats.counts["short_circuited"] += 1
+            raise
+
+        hedge_after = dep.hedge_after if hedge is not False and method in IDEMPOTENT_METHODS else None
+        stats.counts["requests"] += 1
+        t0 = time.perf_counter()
+        try:
+            client = self._client(dependency)
+            if hedge_after is not None:
+                send = self._hedged(client, stats, hedge_after, method, url, kwargs)
+            else:
+                send = client.request(method, url, **kwargs)
+            response = await asyncio.wait_for(send, dep.timeout)
+        except asyncio.TimeoutError:
+            stats.counts["errors"] += 1
+            breaker.record_failure()
+            raise httpx.TimeoutException(f"{dependency} did not answer within {dep.timeout}s")
+        except asyncio.CancelledError:
+            if is_probe:
+                breaker.release_probe()  # caller went away; let the next call probe instead
+            raise
+        except Exception:
+            # anything a transport can raise (InvalidURL, RuntimeError...) counts; a probe
+            # that escaped without a verdict would leave the breaker half-open for good
+            stats.counts["errors"] += 1
+            breaker.record_failure()
+            raise
+        finally:
+            stats.observe((time.perf_counter() - t0) * 1000)
+
+        if _is_failure(response):
+            stats.counts["errors"] += 1
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    async def _hedged(self, client: httpx.AsyncClient, stats: LatencyStats, hedge_after: float,
+                      method: str, url: str, kwargs: Dict[str, Any]) -> httpx.Response:
+        first = asyncio.ensure_future(client.request(method, url, **kwargs))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                stats.counts["hedged"] += 1
+                tasks.add(asyncio.ensure_future(client.request(method, url, **kwargs)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and not _is_failure(task.result()):
+                        if task is not first:
+                            stats.counts["hedge_wins"] += 1
+                        return task.result()
+                    error = error or task.exception()
+                    last = task
+            if error is not None:
+                raise error
+            return last.result()  # both answered with an error status; hand back the last one
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get(self, dependency: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(dependency, "GET", url, **kwargs)
+
+    async def post(self, dependency: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(dependency, "POST", url, **kwargs)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            name: {**stats.snapshot(), "circuit": self.breakers[name].state,
+                   "http2": HTTP2_AVAILABLE and self.transport is None}
+            for name, stats in self.stats.items()
+        }
+
+    async def aclose(self):
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+
+
+_http: Optional[HttpClient] = None
+
+
+def get_http() -> HttpClient:
+    global _http
+    if _http is None:
+        _http = HttpClient()
+    return _http
+
+
+def set_http(client: Optional[HttpClient]) -> Optional[HttpClient]:
+    """Replace the shared client (tests, fake servers). Returns the previous one; close it yourself."""
+    global _http
+    previous, _http = _http, client
+    return previous
@@ -1,15 +1,19 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, PlainTextResponse
 from pydantic import BaseModel
-from fastapi import Depends, Header
+from fastapi import Depends, Header, Query
+from fastapi.responses import StreamingResponse
 
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, AsyncIterator
 from datetime import datetime, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
 import asyncio
+import json
 import os
 import logging
+from collections import deque
 from google.cloud import firestore
 from google.cloud import secretmanager
 import google.auth
@@ -21,7 +25,17 @@ from agents import (
     IntakeAgent, EligibilityAgent, PrefillAgent,
     LocatorAgent, CalendarAgent, ImpactAgent
 )
+from agents.calendar_feed import accepts_gzip
 from a2a_protocol import A2ACoordinator, MessageType
+from site_cache import (
+    NearbySiteCache, etag_for, etag_matches,
+    query_fingerprint, encode_cursor, decode_cursor, paginate, site_position
+)
+from profiling import profiler, ProfilingMiddleware
+from http_client import get_http
+from admission import (
+    AdmissionController, AdmissionMiddleware, RouteRule, PRIORITY_READ, PRIORITY_WRITE, verified_tokens
+)
 
 import firebase_admin
 from firebase_admin import auth as fb_auth, credentials
@@ -48,6 +62,7 @@ async def get_current_user(authorization: str = Header(None)):
     token = authorization.split(" ", 1)[1]
     try:
         decoded = fb_auth.verify_id_token(token)
+        verified_tokens.remember(token, decoded)  # admission can now bucket this caller by uid
         return decoded  # contains uid, email, etc.
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
@@ -63,6 +78,53 @@ app = FastAPI(
     version="1.0.0"
 )
 
+ADMIN_UIDS = {uid for uid in os.getenv("ADMIN_UIDS", "").split(",") if uid}
+
+def is_admin(user: dict) -> bool:
+    """Admins carry the `admin` custom claim or are listed in ADMIN_UIDS."""
+    return user.get("admin") is True or user.get("uid") in ADMIN_UIDS
+
+async def require_admin(user=Depends(get_current_user)):
+    if is_admin(user):
+        return user
+    raise HTTPException(status_code=403, detail="Admin only")
+
+async def optional_user(authorization: str = Header(None)):
+    """Like get_current_user, but anonymous callers get None (a bad token is still a 401)."""
+    if not authorization:
+        return None
+    return await get_current_user(authorization)
+
+def owns_document(user: dict, doc: dict) -> bool:
+    """The uid that started the intake, or a verified sign-in email matching the form's contact email."""
+    if doc.get("owner_uid") and doc["owner_uid"] == user.get("uid"):
+        return True
+    email = ((doc.get("form") or {}).get("email") or "").strip().lower()
+    return bool(email) and user.get("email_verified") is True and (user.get("email") or "").lower() == email
+
+# Tags requests with their route while a profiling session is running (no-op otherwise)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Admission control: per-route concurrency + queue budgets, per-client token buckets,
+# status reads ahead of new writes. Buckets are generous because shelters and schools
+# put many families behind one IP. Added before CORS so rejections still get CORS headers.
+admission = AdmissionController(
+    rules=[
+        RouteRule("/api/intake", methods={"POST"}, max_concurrent=32, max_queue=200,
+                  queue_timeout=2.0, priority=PRIORITY_WRITE, rate=1.0, burst=20),
+        RouteRule("/api/eligibility/check", methods={"POST"}, max_concurrent=32, max_queue=200,
+                  queue_timeout=2.0, priority=PRIORITY_WRITE, rate=2.0, burst=20),
+        RouteRule("/api/application/status/", methods={"GET"}, prefix=True, max_concurrent=64,
+                  max_queue=500, queue_timeout=1.0, priority=PRIORITY_READ, rate=2.0, burst=20),
+        RouteRule("/api/sites/nearby", methods={"GET"}, max_concurrent=64, max_queue=500,
+                  queue_timeout=1.0, priority=PRIORITY_READ, rate=5.0, burst=30),
+    ],
+    backend_concurrency=int(os.getenv("ADMISSION_BACKEND_CONCURRENCY", "64")),
+    # Cloud Run's front end appends the real client IP as the right-most X-Forwarded-For entry
+    trusted_proxy_hops=int(os.getenv("ADMISSION_TRUSTED_PROXY_HOPS", "1")),
+)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -93,6 +155,10 @@ a2a_coordinator.register_agent("locator", locator_agent)
 a2a_coordinator.register_agent("calendar", calendar_agent)
 a2a_coordinator.register_agent("impact", impact_agent)
 
+# Nearby-site responses are cached per geohash cell; drop entries when a site changes
+nearby_cache = NearbySiteCache(ttl_seconds=float(os.getenv("NEARBY_CACHE_TTL", "300")))
+locator_agent.site_listeners.append(nearby_cache.invalidate_site)
+
 # ----- Models (requests/responses) -----
 class IntakeRequest(BaseModel):
     address: str
@@ -121,7 +187,7 @@ class ApplicationStatusResponse(BaseModel):
 # ----- API Endpoints (keep these BEFORE mounting static) -----
 
 @app.post("/api/intake")
-async def start_intake(request: IntakeRequest, background_tasks: BackgroundTasks):
+async def start_intake(request: IntakeRequest, background_tasks: BackgroundTasks, user=Depends(optional_user)):
     try:
         family = Family(
             address=request.address,
@@ -131,6 +197,7 @@ async def start_intake(request: IntakeRequest, background_tasks: BackgroundTasks
             contact_phone=request.contact_phone,
             preferred_language=request.preferred_language,
             children_ages=request.children_ages,
+            owner_uid=user.get("uid") if user else None,
             created_at=datetime.utcnow()
         )
         family_id = await db.create_family(family)
@@ -148,7 +215,8 @@ async def start_intake(request: IntakeRequest, background_tasks: BackgroundTasks
             payload=workflow_message
         )
 
-        background_tasks.add_task(process_intake_workflow, family_id, request.dict())
+        background_tasks.add_task(process_intake_workflow, family_id, request.dict(),
+                                  user.get("uid") if user else None)
 
         return {
             "success": True,
@@ -201,37 +269,73 @@ async def check_eligibility(request: EligibilityCheckRequest):
 
 @app.get("/api/sites/nearby")
 async def find_nearby_sites(
+    request: Request,
     latitude: float,
     longitude: float,
     radius_miles: float = 5.0,
-    meal_type: Optional[str] = None
+    meal_type: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    stream: bool = False
 ):
     try:
-        locator_message = {
-            "action": "find_sites",
-            "location": {"lat": latitude, "lng": longitude},
-            "radius_miles": radius_miles,
-            "filters": {"meal_type": meal_type, "open_now": True}
-        }
-
-        response = await a2a_coordinator.send_message(
-            sender="api",
-            receiver="locator",
-            message_type=MessageType.REQUEST,
-            payload=locator_message
-        )
+        fingerprint = query_fingerprint(latitude, longitude, radius_miles, meal_type)
+        try:
+            position = decode_cursor(cursor, fingerprint) if cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+            sites = locator_agent.iter_sites(
+                {"lat": latitude, "lng": longitude}, radius_miles, meal_type
+            )
+            return StreamingResponse(
+                stream_sites_ndjson(sites, position, limit, fingerprint),
+                media_type="application/x-ndjson"
+            )
+
+        cache_key = nearby_cache.key_for(latitude, longitude, radius_miles, meal_type)
+        candidates = nearby_cache.get(cache_key)
+        if candidates is None:
+            # ask for the whole cell so the result can be reused by neighbours
+            center, query_radius = nearby_cache.query_area(cache_key)
+            locator_message = {
+                "action": "find_sites",
+                "location": center,
+                "radius_miles": query_radius,
+                "filters": {"meal_type": meal_type, "open_now": True}
+            }
 
-        sites = response.payload.get("sites", [])
+            response = await a2a_coordinator.send_message(
+                sender="api",
+                receiver="locator",
+                message_type=MessageType.REQUEST,
+                payload=locator_message
+            )
+            candidates = response.payload.get("sites", [])
+            nearby_cache.put(cache_key, candidates)
+
+        ranked = nearby_cache.rank(candidates, latitude, longitude, radius_miles)
+        # only enrich the page we're about to send
+        sites, next_cursor = paginate(ranked, position, limit, fingerprint)
         for site in sites:
             site["current_wait_time"] = await get_site_wait_time(site["id"])
             site["meals_available"] = await get_meals_available(site["id"])
 
-        return {
+        body = {
             "sites": sites,
-            "total_found": len(sites),
+            "total_found": len(ranked),
             "search_radius": radius_miles,
+            "next_cursor": next_cursor,
             "timestamp": datetime.utcnow().isoformat()
         }
+        etag = etag_for(body)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(body, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Site locator error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -249,7 +353,8 @@ async def schedule_pickup(
             "family_id": family_id,
             "site_id": site_id,
             "pickup_date": pickup_date,
-            "meal_type": meal_type
+            "meal_type": meal_type,
+            "site": locator_agent.get_site(site_id) or {}
         }
 
         response = await a2a_coordinator.send_message(
@@ -258,6 +363,8 @@ async def schedule_pickup(
             message_type=MessageType.REQUEST,
             payload=calendar_message
         )
+        if response.payload.get("error"):
+            raise HTTPException(status_code=400, detail=response.payload["error"])
 
         await notification_service.send_pickup_reminder(
             family_id=family_id,
@@ -270,12 +377,56 @@ async def schedule_pickup(
             "calendar_event_id": response.payload.get("event_id"),
             "confirmation_number": response.payload.get("confirmation"),
             "reminder_set": True,
-            "qr_code": response.payload.get("qr_code")
+            "qr_code": response.payload.get("qr_code"),
+            "calendar_feed_url": response.payload.get("feed_url")
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Scheduling error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/calendar/{feed_token}.ics")
+async def calendar_feed(feed_token: str, request: Request):
+    """
+    Serves the precomputed snapshot; polls that match ETag/Last-Modified get a bare 304.
+    The unguessable feed token (from feed_url) is the credential: calendar apps can't log in.
+    """
+    snapshot = calendar_agent.feeds.snapshot_for_token(feed_token)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="No such calendar")
+
+    accept_gzip = accepts_gzip(request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": snapshot.etag_for(accept_gzip),
+        "Last-Modified": format_datetime(snapshot.last_modified, usegmt=True),
+        "Cache-Control": "private, max-age=300",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if not if_none_match and request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+            if snapshot.last_modified <= since:
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    if accept_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return Response(
+        content=snapshot.body(accept_gzip),
+        media_type="text/calendar; charset=utf-8",
+        headers=headers
+    )
+
+@app.get("/api/schools/search")
+async def search_schools(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50)):
+    # autocomplete for the intake form; local index, no backend round trip
+    return {"query": q, "results": intake_agent.schools.search(q, limit=limit)}
+
 @app.get("/api/impact/dashboard")
 async def impact_dashboard():
     try:
@@ -298,20 +449,131 @@ async def get_application_status(family_id: str):
         if not family:
             raise HTTPException(status_code=404, detail="Family not found")
 
-        status_data = await a2a_coordinator.get_workflow_status(family_id)
+        status_data = await a2a_coordinator.get_workflow_status(family_id, max_sites=5)
 
         return ApplicationStatusResponse(
             family_id=family_id,
             status=status_data["status"],
             eligible_programs=status_data["programs"],
-            nearest_sites=status_data["sites"][:5],
+            nearest_sites=status_data["sites"],
             next_steps=status_data["next_steps"],
             estimated_benefit_value=status_data["monthly_value"]
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Status check error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+SSE_KEEPALIVE_SECONDS = 15
+
+@app.get("/api/application/events/{family_id}")
+async def application_events(family_id: str, request: Request):
+    """
+    Server-Sent Events: a snapshot of the workflow first, then one event per
+    step as it completes. Replaces polling /api/application/status.
+    """
+    # cheap early 429; the real subscribe happens inside stream() so its finally always unsubscribes
+    if a2a_coordinator.events.subscriber_count(family_id) >= a2a_coordinator.events.max_subscribers:
+        raise HTTPException(status_code=429, detail=f"Too many subscribers for workflow {family_id}")
+
+    def sse(event: str, data: dict) -> bytes:
+        return f"id: {data.get('seq', 0)}\nevent: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+    def current_snapshot() -> dict:
+        return a2a_coordinator.events.snapshot(family_id) or \
+            {"workflow_id": family_id, "seq": 0, "status": "unknown", "steps": {}}
+
+    async def stream():
+        try:
+            sub = a2a_coordinator.events.subscribe(family_id)
+        except OverflowError as e:  # lost the race with other subscribers since the check above
+            yield sse("error", {"detail": str(e)})
+            return
+        try:
+            snapshot = current_snapshot()
+            yield sse("snapshot", snapshot)
+            if snapshot["status"] in ("completed", "error"):
+                return
+            dropped = 0
+            while not await request.is_disconnected():
+                event = await sub.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield b": keepalive\n\n"
+                    continue
+                if event["seq"] <= snapshot["seq"]:
+                    continue  # still queued from before the last snapshot, which already covers it
+                if sub.dropped != dropped:
+                    # we fell behind and lost events: resync with a fresh snapshot, which
+                    # already includes the event just read (possibly the final one)
+                    dropped = sub.dropped
+                    snapshot = current_snapshot()
+                    yield sse("snapshot", snapshot)
+                    if snapshot["status"] in ("completed", "error"):
+                        return
+                    continue
+                yield sse("step", event)
+                if event["step"] == "workflow":
+                    return
+        finally:
+            a2a_coordinator.events.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+FORM_MEDIA_TYPES = {"pdf": "application/pdf", "html": "text/html; charset=utf-8"}
+
+@app.get("/api/application/{family_id}/form.{fmt}")
+async def get_prefilled_form(family_id: str, fmt: str, user=Depends(get_current_user)):
+    # the form carries address, contact details, income and case numbers
+    if fmt not in FORM_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Unknown format")
+    doc = prefill_agent.documents.get(family_id)
+    if doc and not (is_admin(user) or owns_document(user, doc)):
+        raise HTTPException(status_code=403, detail="Not your application")
+    if not doc or fmt not in doc:
+        raise HTTPException(status_code=404, detail="No prefilled application yet")
+    return Response(
+        content=doc[fmt],
+        media_type=FORM_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'inline; filename="meal-application-{family_id}.{fmt}"'}
+    )
+
+@app.post("/api/admin/profile")
+async def profile_server(
+    seconds: float = Query(10.0, gt=0, le=120),
+    interval_ms: float = Query(5.0, ge=1, le=100),
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope|summary)$"),
+    user=Depends(require_admin)
+):
+    """
+    Sample the whole process for `seconds` and return a flame graph: collapsed
+    stacks (flamegraph.pl / speedscope) or speedscope JSON. Stacks are rooted
+    at the route and A2A agent/action that were running.
+    """
+    profiler.register_agents(a2a_coordinator.agents)
+    try:
+        profiler.start(interval=interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Profiling started by {user.get('uid')} for {seconds}s")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+
+    if format == "speedscope":
+        return JSONResponse(
+            profiler.speedscope(),
+            headers={"Content-Disposition": 'attachment; filename="mealsync.speedscope.json"'}
+        )
+    if format == "summary":
+        return profiler.summary()
+    return PlainTextResponse(profiler.collapsed())
+
 # ----- Utility / health -----
 
 # app.mount("/", StaticFiles(directory="web", html=True), name="static")
@@ -320,50 +582,102 @@ async def get_application_status(family_id: str):
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "agents": a2a_coordinator.get_metrics(),
+        "admission": admission.snapshot(),
+        "nearby_cache": nearby_cache.stats,
+        "http": get_http().snapshot(),
+    }
+
 # Background workflow
-async def process_intake_workflow(family_id: str, intake_data: dict):
+async def process_intake_workflow(family_id: str, intake_data: dict, owner_uid: Optional[str] = None):
+    # each step publishes started/completed events that /api/application/events streams
     try:
-        await a2a_coordinator.send_message(
-            sender="workflow",
-            receiver="intake",
-            message_type=MessageType.REQUEST,
-            payload={"action": "verify_enrollment", "family_id": family_id}
+        await a2a_coordinator.run_step(
+            family_id, "intake",
+            {"action": "verify_enrollment", "family_id": family_id,
+             "school_name": intake_data.get("school_name")}
         )
-        await a2a_coordinator.send_message(
-            sender="workflow",
-            receiver="eligibility",
-            message_type=MessageType.REQUEST,
-            payload={"action": "auto_check", "family_id": family_id}
+        eligibility = await a2a_coordinator.run_step(
+            family_id, "eligibility",
+            {"action": "auto_check", "family_id": family_id}
         )
-        await a2a_coordinator.send_message(
-            sender="workflow",
-            receiver="prefill",
-            message_type=MessageType.REQUEST,
-            payload={"action": "prefill_application", "family_id": family_id}
+        await a2a_coordinator.run_step(
+            family_id, "prefill",
+            {"action": "prefill_application", "family_id": family_id,
+             "family": intake_data, "eligibility": eligibility.payload or {}, "owner_uid": owner_uid}
         )
-        await a2a_coordinator.send_message(
-            sender="workflow",
-            receiver="locator",
-            message_type=MessageType.REQUEST,
-            payload={"action": "find_best_sites", "family_id": family_id}
+        await a2a_coordinator.run_step(
+            family_id, "locator",
+            {"action": "find_best_sites", "family_id": family_id,
+             "address": intake_data.get("address")}
         )
-        await a2a_coordinator.send_message(
-            sender="workflow",
-            receiver="calendar",
-            message_type=MessageType.REQUEST,
-            payload={"action": "suggest_schedule", "family_id": family_id}
+        await a2a_coordinator.run_step(
+            family_id, "calendar",
+            {"action": "suggest_schedule", "family_id": family_id}
         )
-        await a2a_coordinator.send_message(
-            sender="workflow",
-            receiver="impact",
-            message_type=MessageType.REQUEST,
-            payload={"action": "record_enrollment", "family_id": family_id}
+        await a2a_coordinator.run_step(
+            family_id, "impact",
+            {"action": "record_enrollment", "family_id": family_id}
         )
         await notification_service.send_welcome(family_id)
+        a2a_coordinator.events.publish(family_id, "workflow", "completed")
     except Exception as e:
         logger.error(f"Workflow processing error: {e}")
+        a2a_coordinator.events.publish(family_id, "workflow", "error", error=str(e))
         await db.update_family_status(family_id, "error", str(e))
 
+async def enrich_site(site: dict) -> dict:
+    site["current_wait_time"] = await get_site_wait_time(site["id"])
+    site["meals_available"] = await get_meals_available(site["id"])
+    return site
+
+async def enrich_sites_stream(sites: AsyncIterator[dict], window: int = 8) -> AsyncIterator[dict]:
+    """Enrichment as a streaming stage: up to `window` lookups in flight, output order preserved."""
+    pending = deque()
+    try:
+        # both loops are covered: a client that disconnects mid-stream closes this generator.
+        # A task leaves `pending` only once it's done, so the finally can cancel the rest.
+        async for site in sites:
+            pending.append(asyncio.ensure_future(enrich_site(site)))
+            if len(pending) >= window:
+                enriched = await pending[0]
+                pending.popleft()
+                yield enriched
+        while pending:
+            enriched = await pending[0]
+            pending.popleft()
+            yield enriched
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def stream_sites_ndjson(sites: AsyncIterator[dict], position, limit: Optional[int],
+                              fingerprint: str) -> AsyncIterator[bytes]:
+    """One {"site": ...} line per site in distance order, then a {"next_cursor": ...} trailer."""
+    more = False
+
+    async def page():
+        nonlocal more
+        sent = 0
+        async for site in sites:
+            if position is not None and site_position(site) <= position:
+                continue
+            if limit and sent >= limit:
+                more = True
+                return
+            sent += 1
+            yield site
+
+    last = None
+    async for site in enrich_sites_stream(page()):
+        last = site
+        yield (json.dumps({"site": site}, default=str) + "\n").encode()
+    next_cursor = encode_cursor(last, fingerprint) if more and last else None
+    yield (json.dumps({"next_cursor": next_cursor}) + "\n").encode()
+
 async def get_site_wait_time(site_id: str) -> int:
     return 5
 
@@ -379,6 +693,11 @@ async def startup_event():
     await notification_service.initialize()
     logger.info("SchoolMeals A2A system started successfully")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    prefill_agent.shutdown()
+    await get_http().aclose()
+
 # ---------- Mount static site LAST ----------
 # This serves files from ./web and falls back to index.html (SPA)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))           # …/mealSync/mealsync
@@ -10,6 +10,7 @@ class Family(BaseModel):
     contact_phone: Optional[str] = None
     preferred_language: str = "en"
     children_ages: List[int] = []
+    owner_uid: Optional[str] = None  # Firebase uid that started the intake, if signed in
     created_at: datetime = datetime.utcnow()
 
 class MealSite(BaseModel):
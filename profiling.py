@@ -0,0 +1,219 @@
+# profiling.py
+"""
+On-demand sampling profiler with route / agent attribution.
+
+A background thread samples every thread's Python stack at a fixed interval
+(default 5ms) while a session is running; nothing is hooked per call, so the
+overhead is a few percent and only while profiling. Samples from the event
+loop thread are attributed to:
+
+- the FastAPI route of the asyncio task that was running (tagged by
+  ProfilingMiddleware only while a session is active), and
+- the A2A agent/action whose handler is on the stack.
+
+Output is collapsed stacks (flamegraph.pl, speedscope, inferno) or speedscope JSON.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# leaf frames that mean "this thread is parked", not using CPU
+_IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"), ("selectors.py", "select"), ("thread.py", "_worker"),
+}
+
+
+def _frame_name(code) -> str:
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.interval = 0.005
+        self.max_depth = 128
+        self.samples: Counter = Counter()
+        self.idle_samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task_labels: Dict[asyncio.Task, str] = {}
+        self._agent_codes: Dict[Any, str] = {}
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ----- attribution -----
+
+    def register_agents(self, agents: Dict[str, Any]):
+        """Map handler code objects to "agent:<id>/<action>" labels."""
+        codes = {}
+        for agent_id, agent in agents.items():
+            for action, fn in (getattr(agent, "_handlers", None) or {}).items():
+                codes[fn.__code__] = f"agent:{agent_id}/{action}"
+            process = getattr(type(agent), "process_message", None)
+            if process is not None and not getattr(agent, "_handlers", None):
+                codes[process.__code__] = f"agent:{agent_id}"
+        self._agent_codes = codes
+
+    def tag_current_task(self, label: str):
+        task = asyncio.current_task()
+        if task is not None and self.active:
+            self._task_labels[task] = label
+
+    def untag_current_task(self):
+        task = asyncio.current_task()
+        if task is not None:
+            self._task_labels.pop(task, None)
+
+    # ----- sampling -----
+
+    def start(self, interval: float = 0.005):
+        if self.active:
+            raise RuntimeError("A profiling session is already running")
+        self.interval = interval
+        self.samples = Counter()
+        self.idle_samples = 0
+        self._task_labels.clear()
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self.started_at, self.stopped_at = time.time(), None
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        self._task_labels.clear()
+        self.stopped_at = time.time()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample(me)
+            except Exception as e:  # never let the profiler take the process down
+                logger.warning("Profiler sample failed: %s", e)
+
+    def _sample(self, me: int):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for tid, frame in sys._current_frames().items():
+            if tid == me:
+                continue
+            leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+            if leaf in _IDLE_LEAVES:
+                self.idle_samples += 1
+                continue
+
+            stack, agent = [], None
+            depth = 0
+            while frame is not None and depth < self.max_depth:
+                code = frame.f_code
+                if agent is None:
+                    agent = self._agent_codes.get(code)
+                stack.append(_frame_name(code))
+                frame = frame.f_back
+                depth += 1
+            stack.reverse()
+
+            if tid == self._loop_thread:
+                task = asyncio.current_task(self._loop)
+                route = self._task_labels.get(task) if task else None
+                root = [f"route:{route}" if route else ("task:" + task.get_name() if task else "loop")]
+            else:
+                root = [f"thread:{names.get(tid, tid)}"]
+            if agent:
+                root.append(agent)
+            self.samples[tuple(root + stack)] += 1
+
+    # ----- output -----
+
+    def collapsed(self) -> str:
+        """One "frame;frame;frame count" line per unique stack, root first."""
+        return "\n".join(f"{';'.join(stack)} {n}" for stack, n in self.samples.most_common()) + "\n"
+
+    def speedscope(self, name: str = "mealsync") -> Dict[str, Any]:
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, n in self.samples.most_common():
+            ids = []
+            for f in stack:
+                if f not in index:
+                    index[f] = len(frames)
+                    frames.append({"name": f})
+                ids.append(index[f])
+            samples.append(ids)
+            weights.append(round(n * self.interval * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "exporter": "mealsync-profiling",
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        by_root: Counter = Counter()
+        for stack, n in self.samples.items():
+            by_root[stack[0]] += n
+            if len(stack) > 1 and stack[1].startswith("agent:"):
+                by_root[stack[1]] += n
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": sum(self.samples.values()),
+            "idle_samples": self.idle_samples,
+            "duration_s": round((self.stopped_at or time.time()) - (self.started_at or time.time()), 3),
+            "top": dict(by_root.most_common(20)),
+        }
+
+
+class ProfilingMiddleware:
+    """Tags each request's asyncio task with its route template, only while a session runs."""
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.active:
+            return await self.app(scope, receive, send)
+        self.profiler.tag_current_task(f"{scope['method']} {self._route_path(scope)}")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.untag_current_task()
+
+    @staticmethod
+    def _route_path(scope) -> str:
+        from starlette.routing import Match
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+        return scope["path"]
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,233 @@
+# school_directory.py
+"""
+In-memory school directory for enrollment verification and school-name autocomplete.
+
+Loaded once from a district CSV (SCHOOL_DIRECTORY_CSV). Two indexes over the
+normalized names:
+
+- prefix tries over name starts and over the other word starts, so "linc"
+  finds "Lincoln Elementary" first and "Abraham Lincoln Academy" after it
+- a trigram index for misspellings ("jeferson elemantary")
+
+Plain dicts/lists; a district's few thousand schools take a millisecond or
+two to search, so verify_enrollment is a local lookup.
+
+CSV columns: id,name,district,city,address (school_id / school_name are accepted too).
+"""
+import os
+import re
+import csv
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# demo directory until a district CSV is configured (matches the demo meal sites)
+DEMO_SCHOOLS: List[Dict[str, str]] = [
+    {"id": "sch-001", "name": "Lincoln Elementary School", "district": "Demo District", "city": "Chicago"},
+    {"id": "sch-002", "name": "Washington Middle School", "district": "Demo District", "city": "Chicago"},
+    {"id": "sch-003", "name": "Jefferson High School", "district": "Demo District", "city": "Chicago"},
+    {"id": "sch-004", "name": "Abraham Lincoln Academy", "district": "Demo District", "city": "Chicago"},
+    {"id": "sch-005", "name": "St. Mary Catholic School", "district": "Demo District", "city": "Chicago"},
+]
+
+# common abbreviations in how parents (and districts) write school names
+_ABBREVIATIONS = {
+    "elem": "elementary", "el": "elementary", "es": "elementary school",
+    "ms": "middle school", "mid": "middle", "hs": "high school", "jhs": "junior high school",
+    "jr": "junior", "sr": "senior", "sch": "school", "schl": "school", "acad": "academy",
+    "ctr": "center", "intl": "international", "st": "saint", "mt": "mount", "ps": "public school",
+}
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+
+
+def normalize_name(name: str, expand_last: bool = True) -> str:
+    """expand_last=False leaves a half-typed last word alone ("st" may be "stevenson")."""
+    words = _NON_WORD.sub(" ", (name or "").lower().replace("'", "")).split()
+    out = [_ABBREVIATIONS.get(w, w) for w in words]
+    if words and not expand_last:
+        out[-1] = words[-1]
+    return " ".join(out)
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class School:
+    id: str
+    name: str
+    district: str = ""
+    city: str = ""
+    address: str = ""
+
+    def as_dict(self) -> Dict[str, str]:
+        return asdict(self)
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids", "full")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.ids: List[int] = []
+        self.full = False  # more names pass through here than ids holds
+
+
+class SchoolDirectory:
+    def __init__(self, schools: List[School], max_ids_per_node: int = 64, trie_depth: int = 12):
+        self.schools = schools
+        self.max_ids_per_node = max_ids_per_node
+        self.trie_depth = trie_depth  # longer queries walk this far, then filter
+        self.normalized = [normalize_name(s.name) for s in schools]
+        self._exact: Dict[str, List[int]] = {}
+        # separate tries, so names that merely contain a word can't crowd out names starting with it
+        self._name_trie = _TrieNode()
+        self._word_trie = _TrieNode()
+        self._grams: Dict[str, List[int]] = {}
+        self._gram_sets: List[frozenset] = []
+
+        # alphabetical insert so each capped trie node keeps a stable, sensible slice
+        self._order = sorted(range(len(schools)), key=lambda i: self.normalized[i])
+        for i in self._order:
+            norm = self.normalized[i]
+            self._exact.setdefault(norm, []).append(i)
+            self._insert(self._name_trie, norm[:trie_depth], i)
+            for m in re.finditer(" ", norm):
+                self._insert(self._word_trie, norm[m.end():m.end() + trie_depth], i)
+        for i, norm in enumerate(self.normalized):
+            grams = frozenset(trigrams(norm))
+            self._gram_sets.append(grams)
+            for g in grams:
+                self._grams.setdefault(g, []).append(i)
+        # trigrams from "school", "elementary"... are in most names; they don't pick candidates
+        self._common_df = max(32, len(schools) // 10)
+
+    def __len__(self) -> int:
+        return len(self.schools)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "SchoolDirectory":
+        schools = []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                name = (row.get("name") or row.get("school_name") or "").strip()
+                if not name:
+                    continue
+                schools.append(School(
+                    id=(row.get("id") or row.get("school_id") or "").strip() or f"sch-{len(schools) + 1:05d}",
+                    name=name,
+                    district=(row.get("district") or "").strip(),
+                    city=(row.get("city") or "").strip(),
+                    address=(row.get("address") or "").strip(),
+                ))
+        return cls(schools)
+
+    @classmethod
+    def from_env(cls) -> "SchoolDirectory":
+        path = os.getenv("SCHOOL_DIRECTORY_CSV")
+        if path:
+            try:
+                directory = cls.from_csv(path)
+                logger.info("Loaded school directory %s (%d schools)", path, len(directory))
+                return directory
+            except Exception as e:
+                logger.error(f"Failed to load school directory {path}, using demo schools: {e}")
+        return cls([School(**s) for s in DEMO_SCHOOLS])
+
+    def _insert(self, root: _TrieNode, text: str, idx: int):
+        node = root
+        for ch in text:
+            node = node.children.setdefault(ch, _TrieNode())
+            if node.ids and node.ids[-1] == idx:
+                continue  # the same word twice in one name
+            if len(node.ids) < self.max_ids_per_node:
+                node.ids.append(idx)
+            else:
+                node.full = True
+
+    def _name_prefix(self, query: str) -> List[int]:
+        return self._walk(self._name_trie, query, lambda n: n.startswith(query))
+
+    def _word_prefix(self, query: str) -> List[int]:
+        """Names with a later word starting with query."""
+        return self._walk(self._word_trie, query, lambda n: f" {query}" in n)
+
+    def _walk(self, root: _TrieNode, query: str, matches) -> List[int]:
+        node = root
+        for ch in query[:self.trie_depth]:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        if node.full:
+            # the capped list isn't every match (a short or very common prefix): scan instead
+            return [i for i in self._order if matches(self.normalized[i])]
+        if len(query) <= self.trie_depth:
+            return node.ids
+        return [i for i in node.ids if matches(self.normalized[i])]
+
+    def _fuzzy(self, query: str, min_score: float) -> List[Tuple[float, int]]:
+        """
+        Dice coefficient over trigrams. Candidates come from the rarer trigrams'
+        posting lists only, then get scored exactly against their trigram sets.
+        """
+        q = trigrams(query)
+        postings = sorted((self._grams[g] for g in q if g in self._grams), key=len)
+        rare = [p for p in postings if len(p) <= self._common_df] or postings[:3]
+        candidates = set()
+        for p in rare:
+            candidates.update(p)
+        scored = []
+        for i in candidates:
+            grams = self._gram_sets[i]
+            score = 2.0 * len(q & grams) / (len(q) + len(grams))
+            if score >= min_score:
+                scored.append((score, i))
+        scored.sort(key=lambda t: (-t[0], self.normalized[t[1]]))
+        return scored
+
+    def search(self, query: str, limit: int = 10, min_score: float = 0.3) -> List[Dict[str, Any]]:
+        """Autocomplete: exact, then prefix (name start before word start), then fuzzy."""
+        norm = normalize_name(query)
+        if not norm:
+            return []
+        results: Dict[int, Tuple[float, str]] = {}
+        for i in self._exact.get(norm, ()):
+            results[i] = (1.0, "exact")
+        typed = normalize_name(query, expand_last=False)
+        # word-start matches are only looked at when name starts don't fill the page
+        for walk, score in ((self._name_prefix, 0.9), (self._word_prefix, 0.8)):
+            if len(results) >= limit:
+                break
+            found = dict.fromkeys(walk(typed) + (walk(norm) if norm != typed else []))
+            for i in sorted(found, key=lambda i: (len(self.normalized[i]), self.normalized[i])):
+                if len(results) >= limit:
+                    break
+                results.setdefault(i, (score, "prefix"))
+        if len(results) < limit:
+            for score, i in self._fuzzy(norm, min_score):
+                if len(results) >= limit:
+                    break
+                results.setdefault(i, (round(min(score, 0.79), 3), "fuzzy"))
+        return [{**self.schools[i].as_dict(), "score": score, "match": kind}
+                for i, (score, kind) in results.items()]
+
+    def match(self, name: str, min_score: float = 0.6) -> Optional[Dict[str, Any]]:
+        """Best single match for enrollment verification, or None if nothing is close enough."""
+        norm = normalize_name(name)
+        if not norm:
+            return None
+        exact = self._exact.get(norm)
+        if exact:
+            return {**self.schools[exact[0]].as_dict(), "score": 1.0, "match": "exact"}
+        starts = self._name_prefix(norm)
+        if len(starts) == 1:  # "lincoln elem" -> the one Lincoln Elementary
+            return {**self.schools[starts[0]].as_dict(), "score": 0.9, "match": "prefix"}
+        fuzzy = self._fuzzy(norm, min_score)
+        if fuzzy and (len(fuzzy) == 1 or fuzzy[0][0] - fuzzy[1][0] >= 0.05):
+            score, i = fuzzy[0]
+            return {**self.schools[i].as_dict(), "score": round(score, 3), "match": "fuzzy"}
+        return None
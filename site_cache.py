@@ -0,0 +1,235 @@
+# site_cache.py
+"""
+Response cache for /api/sites/nearby.
+
+Nearby-site queries are keyed by the geohash cell of the query point (plus
+radius and filters), not the exact coordinates. On a miss we ask the locator
+for everything within radius + the cell's half-diagonal of the cell center,
+which is a superset of the answer for any point inside the cell; each caller
+then gets that list re-filtered and re-ranked by their exact distance.
+"""
+import json
+import math
+import time
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from geocoding import haversine_miles
+
+logger = logging.getLogger(__name__)
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+MILES_PER_DEG_LAT = 69.0
+
+
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            ch = (ch << 1) | (lng >= mid)
+            lng_lo, lng_hi = (mid, lng_hi) if lng >= mid else (lng_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            ch = (ch << 1) | (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+
+def geohash_bounds(cell: str) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lng_min, lng_max) of a geohash cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in cell:
+        v = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (v >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def cell_half_diagonal_miles(cell: str) -> float:
+    lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(cell)
+    return haversine_miles(lat_lo, lng_lo, lat_hi, lng_hi) / 2
+
+
+def precision_for_radius(radius_miles: float, slack: float = 0.25) -> int:
+    """
+    Coarsest geohash precision whose cells are small next to the radius,
+    so the superset query stays close to the real one.
+    """
+    for precision in range(1, 10):
+        # cell height in miles at this precision (lat gets floor(5p/2) bits)
+        height = 180.0 / (1 << (5 * precision // 2)) * MILES_PER_DEG_LAT
+        width = 360.0 / (1 << (5 * precision - 5 * precision // 2)) * MILES_PER_DEG_LAT
+        if math.hypot(height, width) / 2 <= radius_miles * slack:
+            return precision
+    return 9
+
+
+def etag_for(body: Dict[str, Any], ignore: Tuple[str, ...] = ("timestamp",)) -> str:
+    """Strong ETag over a JSON body, ignoring volatile fields like the response timestamp."""
+    stable = {k: v for k, v in body.items() if k not in ignore}
+    digest = hashlib.sha1(json.dumps(stable, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+@dataclass
+class _Entry:
+    sites: List[Dict[str, Any]]
+    center: Tuple[float, float]
+    query_radius: float
+    expires_at: float
+    site_ids: Set[str] = field(default_factory=set)
+
+
+class NearbySiteCache:
+    def __init__(self, ttl_seconds: float = 300.0, max_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "invalidated": 0}
+
+    def key_for(self, lat: float, lng: float, radius_miles: float,
+                meal_type: Optional[str] = None) -> tuple:
+        cell = geohash_encode(lat, lng, precision_for_radius(radius_miles))
+        return (cell, round(float(radius_miles), 3), meal_type or "")
+
+    @staticmethod
+    def query_area(key: tuple) -> Tuple[Dict[str, float], float]:
+        """Location + radius to ask the locator for so every point in the cell is covered."""
+        cell, radius, _ = key
+        lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(cell)
+        center = {"lat": (lat_lo + lat_hi) / 2, "lng": (lng_lo + lng_hi) / 2}
+        return center, radius + cell_half_diagonal_miles(cell)
+
+    def get(self, key: tuple) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry.sites
+
+    def put(self, key: tuple, sites: List[Dict[str, Any]]):
+        center, query_radius = self.query_area(key)
+        self._entries[key] = _Entry(
+            sites=sites,
+            center=(center["lat"], center["lng"]),
+            query_radius=query_radius,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            site_ids={s.get("id") for s in sites},
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_site(self, site: Dict[str, Any]):
+        """
+        Drop entries that list this site, plus entries whose area covers its
+        (possibly new) location so an added or moved site shows up.
+        """
+        site_id = site.get("id")
+        lat, lng = site.get("lat"), site.get("lng")
+        stale = []
+        for key, entry in self._entries.items():
+            if site_id in entry.site_ids:
+                stale.append(key)
+            elif lat is not None and lng is not None and \
+                    haversine_miles(entry.center[0], entry.center[1], lat, lng) <= entry.query_radius:
+                stale.append(key)
+        for key in stale:
+            del self._entries[key]
+        self.stats["invalidated"] += len(stale)
+
+    def clear(self):
+        self.stats["invalidated"] += len(self._entries)
+        self._entries.clear()
+
+    @staticmethod
+    def rank(sites: List[Dict[str, Any]], lat: float, lng: float,
+             radius_miles: float) -> List[Dict[str, Any]]:
+        """Copies of the cached sites within radius of (lat, lng), by exact distance."""
+        out = []
+        for site in sites:
+            if "lat" in site and "lng" in site:
+                distance = round(haversine_miles(lat, lng, site["lat"], site["lng"]), 2)
+                if distance > radius_miles:
+                    continue
+                site = {**site, "distance_miles": distance}
+            else:
+                site = dict(site)
+            out.append(site)
+        out.sort(key=site_position)
+        return out
+
+
+# ----- cursor pagination -----
+# A cursor is the (distance, id) of the last site sent, tied to the exact query
+# it came from, so pages stay stable even if the cache entry is rebuilt.
+
+def site_position(site: Dict[str, Any]) -> Tuple[float, str]:
+    return (site.get("distance_miles") or 0.0, str(site.get("id")))
+
+
+def query_fingerprint(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:12]
+
+
+def encode_cursor(site: Dict[str, Any], fingerprint: str) -> str:
+    distance, site_id = site_position(site)
+    raw = json.dumps({"d": distance, "id": site_id, "q": fingerprint}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Tuple[float, str]:
+    """Raises ValueError for malformed cursors or cursors from a different query."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        position = (float(data["d"]), str(data["id"]))
+    except Exception:
+        raise ValueError("malformed cursor")
+    if data.get("q") != fingerprint:
+        raise ValueError("cursor does not belong to this query")
+    return position
+
+
+def paginate(sites: List[Dict[str, Any]], position: Optional[Tuple[float, str]],
+             limit: Optional[int], fingerprint: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Sites (already in site_position order) after `position`, plus the next cursor if more remain."""
+    if position is not None:
+        sites = [s for s in sites if site_position(s) > position]
+    if not limit or len(sites) <= limit:
+        return sites, None
+    page = sites[:limit]
+    return page, encode_cursor(page[-1], fingerprint)
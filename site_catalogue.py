@@ -0,0 +1,287 @@
+# site_catalogue.py
+"""
+Compact, memory-mapped meal-site catalogue.
+
+Built offline from a site CSV into a directory of flat files (each build is a
+new hidden version directory; the catalogue path is a symlink swapped onto it):
+
+    meta.json          version, row count, meal_types / accessibility vocabularies
+    sites.npy          one structured row per site (coords, capacity, bitmasks,
+                       string-table indices, id sort rank)
+    strings.bin        interned UTF-8 strings (ids, names, addresses, phones)
+    string_offsets.npy uint64 offsets into strings.bin
+
+At startup everything is np.load(..., mmap_mode="r"), so opening a national
+list takes milliseconds and every worker process shares the same page-cache
+pages. Dicts are only materialized for the sites a request actually returns.
+
+    python site_catalogue.py build sites.csv catalogue/
+    python site_catalogue.py info catalogue/
+
+CSV columns: id,name,address,phone,lat,lng,daily_capacity,meal_types,accessibility
+(list columns are separated by ";" or "|").
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import shutil
+import tempfile
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+import numpy as np
+
+from agents.site_assignment import (
+    MEAL_TYPES, ACCESSIBILITY, SiteAssigner, assign_with, extend_vocab, encode_masks,
+)
+
+FORMAT_VERSION = 1
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEG_LAT = 69.0
+
+SITE_DTYPE = np.dtype([
+    ("lat", "<f8"), ("lng", "<f8"),
+    ("capacity", "<u4"), ("meal_mask", "<u4"), ("access_mask", "<u4"),
+    ("id", "<u4"), ("name", "<u4"), ("address", "<u4"), ("phone", "<u4"),
+    ("id_rank", "<u4"),  # position of the id in sorted order, for stable (distance, id) ordering
+])
+
+
+def _split_list(value: str) -> List[str]:
+    return [v.strip().lower() for v in re.split(r"[;|]", value or "") if v.strip()]
+
+
+def build_catalogue(csv_path: str, out_dir: str) -> Dict[str, Any]:
+    """
+    Build a catalogue from a site CSV into a new version directory, then point
+    the out_dir symlink at it with a single rename: a worker starting mid-build
+    opens either the old catalogue or the new one, never nothing.
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+
+    meal_lists = [_split_list(r.get("meal_types", "")) for r in rows]
+    access_lists = [_split_list(r.get("accessibility", "")) for r in rows]
+    meal_vocab = extend_vocab(MEAL_TYPES, meal_lists)
+    access_vocab = extend_vocab(ACCESSIBILITY, access_lists)
+
+    strings: List[str] = []
+    interned: Dict[str, int] = {}
+
+    def intern(s: str) -> int:
+        s = (s or "").strip()
+        idx = interned.get(s)
+        if idx is None:
+            idx = interned[s] = len(strings)
+            strings.append(s)
+        return idx
+
+    intern("")  # index 0 is the empty string
+    sites = np.zeros(len(rows), dtype=SITE_DTYPE)
+    for i, r in enumerate(rows):
+        sites[i]["lat"] = float(r["lat"])
+        sites[i]["lng"] = float(r["lng"])
+        sites[i]["capacity"] = int(float(r.get("daily_capacity") or 0))
+        sites[i]["id"] = intern(r["id"])
+        sites[i]["name"] = intern(r.get("name", ""))
+        sites[i]["address"] = intern(r.get("address", ""))
+        sites[i]["phone"] = intern(r.get("phone", ""))
+    sites["meal_mask"] = encode_masks(meal_lists, meal_vocab)
+    sites["access_mask"] = encode_masks(access_lists, access_vocab)
+    ids = [r["id"] for r in rows]
+    if len(set(ids)) != len(ids):
+        raise ValueError("duplicate site ids in CSV")
+    rank = np.empty(len(rows), dtype=np.uint32)
+    rank[sorted(range(len(ids)), key=ids.__getitem__)] = np.arange(len(rows), dtype=np.uint32)
+    sites["id_rank"] = rank
+
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "count": len(rows),
+        "strings": len(strings),
+        "meal_types": meal_vocab,
+        "accessibility": access_vocab,
+        "source": os.path.basename(csv_path),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+    out_dir = os.path.abspath(out_dir)
+    parent = os.path.dirname(out_dir)
+    os.makedirs(parent, exist_ok=True)
+    version = tempfile.mkdtemp(prefix=_version_prefix(out_dir), dir=parent)
+    try:
+        np.save(os.path.join(version, "sites.npy"), sites)
+        np.save(os.path.join(version, "string_offsets.npy"), offsets)
+        with open(os.path.join(version, "strings.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        with open(os.path.join(version, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        _publish(version, out_dir)
+    except BaseException:
+        shutil.rmtree(version, ignore_errors=True)
+        raise
+    return meta
+
+
+def _version_prefix(out_dir: str) -> str:
+    return f".{os.path.basename(out_dir)}-"
+
+
+def _publish(version: str, out_dir: str):
+    """Swap the out_dir symlink onto version; keeps the previous version for workers still opening it."""
+    parent = os.path.dirname(out_dir)
+    previous = None
+    if os.path.islink(out_dir):
+        previous = os.path.realpath(out_dir)
+    elif os.path.isdir(out_dir):
+        # a catalogue from before versioned builds: move it aside once so out_dir can become a link
+        previous = tempfile.mkdtemp(prefix=_version_prefix(out_dir), dir=parent)
+        os.rmdir(previous)
+        os.rename(out_dir, previous)
+    link = version + ".link"
+    os.symlink(os.path.basename(version), link)  # relative, so the tree can be moved as a whole
+    os.replace(link, out_dir)
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if (name.startswith(_version_prefix(out_dir)) and os.path.isdir(path) and not os.path.islink(path)
+                and path not in (version, previous)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class SiteCatalogue:
+    """Read-only view over a built catalogue. Columns are memory-mapped numpy arrays."""
+
+    def __init__(self, path: str):
+        # resolve the symlink once so every file comes from the same build
+        self.path = path = os.path.realpath(path)
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported site catalogue version: {self.meta.get('format_version')}")
+        self.sites = np.load(os.path.join(path, "sites.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(path, "string_offsets.npy"), mmap_mode="r")
+        strings_path = os.path.join(path, "strings.bin")
+        self._strings = (np.memmap(strings_path, dtype=np.uint8, mode="r")
+                         if os.path.getsize(strings_path) else np.zeros(0, dtype=np.uint8))
+        self.meal_types: List[str] = self.meta["meal_types"]
+        self.accessibility: List[str] = self.meta["accessibility"]
+        self._meal_bit = {m: 1 << i for i, m in enumerate(self.meal_types)}
+        self._id_index: Optional[Dict[str, int]] = None
+        self._assigners: Dict[int, SiteAssigner] = {}
+
+    @classmethod
+    def open(cls, path: str) -> "SiteCatalogue":
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+    def string(self, idx: int) -> str:
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return self._strings[start:end].tobytes().decode("utf-8")
+
+    def _labels(self, mask: int, vocab: List[str]) -> List[str]:
+        return [name for i, name in enumerate(vocab) if mask & (1 << i)]
+
+    def site_id(self, i: int) -> str:
+        return self.string(int(self.sites[i]["id"]))
+
+    def site(self, i: int) -> Dict[str, Any]:
+        """Materialize one row as the same dict shape LocatorAgent uses elsewhere."""
+        row = self.sites[i]
+        return {
+            "id": self.string(int(row["id"])),
+            "name": self.string(int(row["name"])),
+            "address": self.string(int(row["address"])),
+            "phone": self.string(int(row["phone"])) or None,
+            "lat": float(row["lat"]),
+            "lng": float(row["lng"]),
+            "daily_capacity": int(row["capacity"]),
+            "meal_types": self._labels(int(row["meal_mask"]), self.meal_types),
+            "accessibility": self._labels(int(row["access_mask"]), self.accessibility),
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self.site(i)
+
+    def index_of(self, site_id: str) -> Optional[int]:
+        if self._id_index is None:
+            # built on first use only; most workers never need it
+            self._id_index = {self.string(int(x)): i for i, x in enumerate(self.sites["id"])}
+        return self._id_index.get(site_id)
+
+    def _meal_filter(self, meal_type: Optional[str]) -> np.ndarray:
+        if not meal_type:
+            return np.ones(len(self), dtype=bool)
+        bit = self._meal_bit.get(meal_type)
+        if bit is None:
+            return np.zeros(len(self), dtype=bool)
+        return (self.sites["meal_mask"] & bit) != 0
+
+    def by_id(self, meal_type: Optional[str] = None) -> np.ndarray:
+        """Indices of matching sites in id order (listing without a location)."""
+        idx = np.flatnonzero(self._meal_filter(meal_type))
+        return idx[np.argsort(self.sites["id_rank"][idx])]
+
+    def nearby(self, lat: float, lng: float, radius_miles: Optional[float] = None,
+               meal_type: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Indices and distances (miles, rounded to 0.01) of matching sites, ordered
+        by (distance, id). A bounding-box prefilter keeps the haversine to nearby rows.
+        """
+        mask = self._meal_filter(meal_type)
+        lat_col, lng_col = self.sites["lat"], self.sites["lng"]
+        if radius_miles is not None:
+            dlat = radius_miles / MILES_PER_DEG_LAT
+            dlng = radius_miles / max(1e-6, MILES_PER_DEG_LAT * np.cos(np.radians(min(89.0, abs(lat) + dlat))))
+            mask &= (np.abs(lat_col - lat) <= dlat) & (np.abs(((lng_col - lng) + 180) % 360 - 180) <= dlng)
+        idx = np.flatnonzero(mask)
+
+        p1, p2 = np.radians(lat), np.radians(lat_col[idx])
+        a = (np.sin((p2 - p1) / 2) ** 2
+             + np.cos(p1) * np.cos(p2) * np.sin(np.radians(lng_col[idx] - lng) / 2) ** 2)
+        dist = np.round(2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0))), 2)
+        if radius_miles is not None:
+            keep = dist <= radius_miles
+            idx, dist = idx[keep], dist[keep]
+        order = np.lexsort((self.sites["id_rank"][idx], dist))
+        return idx[order], dist[order]
+
+    def assigner(self, k: int = 8) -> SiteAssigner:
+        """Reused across batches: the unit vectors for a national list are worth keeping."""
+        if k not in self._assigners:
+            self._assigners[k] = SiteAssigner(self.sites["lat"], self.sites["lng"], self.sites["capacity"],
+                                              self.sites["meal_mask"], self.sites["access_mask"], k=k)
+        return self._assigners[k]
+
+    def assign_families(self, families: List[Dict[str, Any]], k: int = 8,
+                        max_distance: Optional[float] = None) -> Dict[str, Any]:
+        """Same output as site_assignment.assign_families, straight off the mapped columns."""
+        meal_vocab = extend_vocab(self.meal_types, [f.get("meal_types") for f in families])
+        access_vocab = extend_vocab(self.accessibility, [f.get("accessibility") for f in families])
+        return assign_with(self.assigner(k), families, self.site_id, meal_vocab, access_vocab, max_distance)
+
+def main(argv: List[str]) -> int:
+    if len(argv) == 3 and argv[0] == "build":
+        t0 = time.perf_counter()
+        meta = build_catalogue(argv[1], argv[2])
+        print(f"built {meta['count']} sites ({meta['strings']} strings) in {time.perf_counter() - t0:.2f}s")
+        return 0
+    if len(argv) == 2 and argv[0] == "info":
+        t0 = time.perf_counter()
+        cat = SiteCatalogue.open(argv[1])
+        print(json.dumps({**cat.meta, "open_ms": round((time.perf_counter() - t0) * 1000, 2)}, indent=2))
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
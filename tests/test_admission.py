@@ -0,0 +1,114 @@
+import asyncio
+
+from admission import (
+    AdmissionController, AdmissionMiddleware, PriorityLimiter, RouteRule, PRIORITY_READ, PRIORITY_WRITE,
+)
+
+
+def test_reads_are_woken_before_queued_writes():
+    async def run():
+        limiter = PriorityLimiter(limit=1, max_queue=10)
+        assert limiter.try_acquire()
+        order = []
+
+        async def waiter(name, priority):
+            assert await limiter.acquire(priority, timeout=1.0)
+            order.append(name)
+
+        write = asyncio.create_task(waiter("write", PRIORITY_WRITE))
+        await asyncio.sleep(0)
+        read = asyncio.create_task(waiter("read", PRIORITY_READ))
+        await asyncio.sleep(0)
+        assert limiter.queued == 2
+
+        limiter.release()
+        await asyncio.sleep(0.01)
+        assert order == ["read"]
+        limiter.release()
+        await asyncio.gather(write, read)
+        assert order == ["read", "write"]
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(run())
+
+
+def test_request_is_shed_with_503_and_retry_after_after_queue_timeout():
+    async def run():
+        rule = RouteRule("/api/intake", methods={"POST"}, max_concurrent=1, queue_timeout=0.1)
+        controller = AdmissionController([rule], trusted_proxy_hops=0)
+        hold = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await hold.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = AdmissionMiddleware(app, controller)
+
+        async def call(ip):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "http", "method": "POST", "path": "/api/intake", "headers": [], "client": (ip, 1)}
+            await middleware(scope, None, send)
+            return sent[0]
+
+        first = asyncio.create_task(call("10.0.0.1"))
+        await asyncio.sleep(0.01)
+        rejected = await call("10.0.0.2")
+        assert rejected["status"] == 503
+        assert (b"retry-after", b"1") in rejected["headers"]
+        assert controller.counters["/api/intake"]["shed_capacity"] == 1
+
+        hold.set()
+        assert (await first)["status"] == 200
+        assert controller.route_limiters["/api/intake"].active == 0 and controller.backend.active == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def run():
+        limiter = PriorityLimiter(limit=1, max_queue=10)
+        assert limiter.try_acquire()
+
+        # cancelled while still queued
+        waiting = asyncio.create_task(limiter.acquire(PRIORITY_WRITE, timeout=1.0))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+        # cancelled after release() already handed it the slot, before it got to run
+        handed = asyncio.create_task(limiter.acquire(PRIORITY_WRITE, timeout=1.0))
+        await asyncio.sleep(0)
+        limiter.release()
+        handed.cancel()
+        await asyncio.gather(handed, return_exceptions=True)
+
+        assert limiter.active == 0 and limiter.queued == 0
+        assert limiter.try_acquire()
+
+    asyncio.run(run())
+
+
+def test_bucket_eviction_drops_only_the_least_recently_used_client():
+    async def run():
+        rule = RouteRule("/api/sites/nearby", rate=0.001, burst=1)
+        controller = AdmissionController([rule], max_clients=2)
+        assert (await controller.admit(rule, "ip:a"))[0]
+        controller.release(rule)
+        assert (await controller.admit(rule, "ip:b"))[0]
+        controller.release(rule)
+        assert (await controller.admit(rule, "ip:a"))[1] == 429  # a is now the most recent
+
+        assert (await controller.admit(rule, "ip:c"))[0]  # evicts b, not a
+        controller.release(rule)
+        assert controller.snapshot()["tracked_clients"] == 2
+        assert (await controller.admit(rule, "ip:a"))[1] == 429  # a's empty bucket survived
+        assert (await controller.admit(rule, "ip:b"))[0]  # b starts over with a fresh bucket
+        controller.release(rule)
+
+    asyncio.run(run())
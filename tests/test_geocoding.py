@@ -0,0 +1,50 @@
+import asyncio
+
+from geocoding import FakeGeocoder, GeocodeCache, GeocodingService, split_unit
+
+
+def test_cancelled_lookup_does_not_strand_waiters():
+    async def run():
+        geocoder = FakeGeocoder(delay=0.2)
+        service = GeocodingService(geocoder, GeocodeCache(":memory:"))
+
+        first = asyncio.create_task(service.geocode("123 Main St Apt 4"))
+        await asyncio.sleep(0.05)  # first lookup is in flight
+        waiter = asyncio.create_task(service.geocode("123 main street #9"))
+        await asyncio.sleep(0.01)  # second one coalesced onto it
+        first.cancel()
+
+        result = await asyncio.wait_for(waiter, 1.0)
+        assert result is not None and result.formatted_address == "123 MAIN ST"
+        assert service._inflight == {}
+        assert len(geocoder.calls) == 2  # the waiter retried after the owner was cancelled
+
+        # later lookups of the building are served from the cache
+        again = await asyncio.wait_for(service.geocode("123 Main St Apt 7"), 1.0)
+        assert again == result
+
+    asyncio.run(run())
+
+
+def test_unit_words_inside_street_names_are_not_units():
+    assert split_unit("10 Lot Rd") == ("10 LOT RD", None)
+    assert split_unit("5 Outer Space Way") == ("5 OUTER SPACE WAY", None)
+    assert split_unit("123 Main St Apt 4") == ("123 MAIN ST", "APT 4")
+
+
+def test_fake_results_are_not_served_to_a_real_geocoder(tmp_path):
+    class RealGeocoder(FakeGeocoder):
+        source = "maps"
+
+        def __init__(self):
+            super().__init__(center=(40.0, -75.0))
+
+    async def run():
+        path = str(tmp_path / "geocode.sqlite3")
+        fake = await GeocodingService(FakeGeocoder(), GeocodeCache(path)).geocode("123 Main St")
+        real_geocoder = RealGeocoder()
+        real = await GeocodingService(real_geocoder, GeocodeCache(path)).geocode("123 Main St")
+        assert real_geocoder.calls  # a miss, not the fake row
+        assert real.source == "maps" and (real.lat, real.lng) != (fake.lat, fake.lng)
+
+    asyncio.run(run())
@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+import pytest
+
+from http_client import CircuitOpenError, Dependency, HttpClient
+
+
+def test_probe_raising_non_httpx_error_reopens_breaker():
+    async def run():
+        mode = {"fail": "status"}
+
+        async def handler(request):
+            if mode["fail"] == "status":
+                return httpx.Response(503)
+            if mode["fail"] == "raise":
+                raise RuntimeError("transport blew up")
+            return httpx.Response(200)
+
+        client = HttpClient([Dependency("x", "https://x.test", failure_threshold=1, reset_timeout=0.01)],
+                            transport=httpx.MockTransport(handler))
+        breaker = client.breakers["x"]
+        await client.get("x", "/")
+        assert breaker.state == "open"
+
+        await asyncio.sleep(0.02)
+        mode["fail"] = "raise"
+        with pytest.raises(RuntimeError):
+            await client.get("x", "/")
+        assert breaker.state == "open"  # not stuck half-open
+
+        await asyncio.sleep(0.02)
+        mode["fail"] = None
+        assert (await client.get("x", "/")).status_code == 200
+        assert breaker.state == "closed"
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_cancelled_non_probe_call_does_not_release_probe():
+    async def run():
+        gate = asyncio.Event()
+
+        async def handler(request):
+            await gate.wait()
+            return httpx.Response(200)
+
+        client = HttpClient([Dependency("x", "https://x.test")], transport=httpx.MockTransport(handler))
+        breaker = client.breakers["x"]
+        slow = asyncio.create_task(client.get("x", "/"))  # sent while the breaker was closed
+        await asyncio.sleep(0.01)
+        breaker.state, breaker._probing = "half_open", True  # meanwhile it tripped and a probe went out
+
+        slow.cancel()
+        await asyncio.gather(slow, return_exceptions=True)
+        assert breaker._probing
+        with pytest.raises(CircuitOpenError):
+            await client.get("x", "/")
+        gate.set()
+        await client.aclose()
+
+    asyncio.run(run())
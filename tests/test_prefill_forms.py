@@ -0,0 +1,17 @@
+import re
+import zlib
+
+from agents.prefill_forms import PAGE_WIDTH, MARGIN, FONT_SIZE, _char_width, build_form, render_form
+
+
+def test_pdf_is_us_letter_and_wraps_long_addresses():
+    address = "12345 North Westmoreland Boulevard Apartment 1204, Chicago Heights, IL 60411-1234, United States"
+    form = build_form({"address": address, "school_name": "Lincoln Elementary", "family_size": 4,
+                       "contact_email": "parent@example.com", "children_ages": [7, 10]}, {"programs": []})
+    pdf = render_form(form, "pdf")
+    assert b"/MediaBox [0 0 612 792]" in pdf
+
+    body = zlib.decompress(re.search(rb"stream\n(.*?)\nendstream", pdf, re.S).group(1)).decode("latin-1")
+    lines = re.findall(r"\((.*?)\) Tj", body)
+    assert any("60411" in l for l in lines) and not any("Westmoreland" in l and "60411" in l for l in lines)
+    assert all(FONT_SIZE * sum(_char_width(c) for c in l) <= PAGE_WIDTH - 2 * MARGIN for l in lines)
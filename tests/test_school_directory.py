@@ -0,0 +1,27 @@
+import random
+
+from school_directory import School, SchoolDirectory
+
+
+def _district(n=2000, seed=7):
+    rng = random.Random(seed)
+    words = ["Adams", "Cedar", "Maple", "Oak", "Pine", "Lincoln", "Jefferson", "Roosevelt",
+             "Washington", "Grant", "Lake", "River", "Valley", "Park", "Hill", "Ridge"]
+    kinds = ["High School", "Middle School", "Elementary School", "Academy"]
+    names = {f"Highland {w} Elementary" for w in words[:6]}
+    while len(names) < n:
+        names.add(f"{rng.choice(words)} {rng.choice(words)} {rng.choice(kinds)} {rng.randint(1, 99)}")
+    return SchoolDirectory([School(id=f"sch-{i}", name=name) for i, name in enumerate(sorted(names))])
+
+
+def test_name_starts_are_not_crowded_out_by_mid_name_words():
+    directory = _district()
+    results = directory.search("high", limit=5)
+    assert [r["name"] for r in results] and all(r["name"].startswith("Highland") for r in results)
+
+
+def test_full_trie_nodes_fall_back_to_scanning():
+    directory = _district()
+    every = [i for i, n in enumerate(directory.normalized) if " high school" in n]
+    assert len(every) > directory.max_ids_per_node
+    assert set(every) <= set(directory._word_prefix("high"))
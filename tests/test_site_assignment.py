@@ -0,0 +1,39 @@
+from collections import Counter
+
+from agents.site_assignment import assign_families
+
+
+SITES = [
+    {"id": "near-small", "lat": 41.880, "lng": -87.630, "daily_capacity": 2,
+     "meal_types": ["lunch"], "accessibility": ["wheelchair"]},
+    {"id": "near-breakfast", "lat": 41.881, "lng": -87.631, "daily_capacity": 50,
+     "meal_types": ["breakfast"], "accessibility": []},
+    {"id": "far-big", "lat": 41.950, "lng": -87.700, "daily_capacity": 50,
+     "meal_types": ["lunch", "breakfast"], "accessibility": ["wheelchair"]},
+]
+
+
+def test_assignments_respect_capacity_and_needs():
+    families = [
+        {"id": f"f{i}", "lat": 41.880, "lng": -87.630, "demand": 1, "meal_types": ["lunch"]} for i in range(4)
+    ] + [
+        {"id": "wheelchair-breakfast", "lat": 41.881, "lng": -87.631, "demand": 1,
+         "meal_types": ["breakfast"], "accessibility": ["wheelchair"]},
+        {"id": "supper", "lat": 41.880, "lng": -87.630, "demand": 1, "meal_types": ["supper"]},
+    ]
+    out = assign_families(families, SITES)
+    by_family = {a["family_id"]: a["site_id"] for a in out["assignments"]}
+    load = Counter(by_family.values())
+
+    # the nearby lunch site only has room for two; the rest spill over to the bigger site
+    assert load["near-small"] == 2
+    assert sum(by_family[f"f{i}"] == "far-big" for i in range(4)) == 2
+    # the closest breakfast site has no wheelchair access
+    assert by_family["wheelchair-breakfast"] == "far-big"
+    # nobody serves supper
+    assert out["unassigned"] == ["supper"]
+    for a in out["assignments"]:
+        site = next(s for s in SITES if s["id"] == a["site_id"])
+        fam = next(f for f in families if f["id"] == a["family_id"])
+        assert set(fam.get("meal_types", [])) <= set(site["meal_types"])
+        assert set(fam.get("accessibility", [])) <= set(site["accessibility"])
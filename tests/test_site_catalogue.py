@@ -0,0 +1,32 @@
+import csv
+import os
+
+from site_catalogue import SiteCatalogue, build_catalogue
+
+
+def _write_sites(path, names):
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "name", "address", "phone", "lat", "lng", "daily_capacity", "meal_types", "accessibility"])
+        for i, name in enumerate(names):
+            w.writerow([f"site-{i}", name, f"{i} Main St", "", 41.88 + i / 100, -87.63, 100, "lunch", ""])
+
+
+def test_rebuild_swaps_the_catalogue_without_a_gap(tmp_path):
+    out = str(tmp_path / "catalogue")
+    os.makedirs(out)  # a catalogue from before versioned builds
+    _write_sites(tmp_path / "v1.csv", ["Old A", "Old B"])
+    build_catalogue(str(tmp_path / "v1.csv"), out)
+    old = SiteCatalogue.open(out)
+
+    _write_sites(tmp_path / "v2.csv", ["New A", "New B", "New C"])
+    build_catalogue(str(tmp_path / "v2.csv"), out)
+    _write_sites(tmp_path / "v3.csv", ["Newest"])
+    build_catalogue(str(tmp_path / "v3.csv"), out)
+
+    assert os.path.islink(out)
+    assert len(SiteCatalogue.open(out)) == 1
+    versions = [n for n in os.listdir(tmp_path) if n.startswith(".catalogue-")]
+    assert len(versions) == 2  # the current build and the one before it
+    # a worker that opened an older build keeps reading it through its own mapping
+    assert old.site(0)["name"] == "Old A"